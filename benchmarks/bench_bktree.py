@@ -0,0 +1,86 @@
+"""
+Benchmarks BKTreeMatcher against the linear scan of GestureMatcher for
+vocabularies from 10 to 100,000 gestures.
+
+Usage:
+    python benchmarks/bench_bktree.py [--sizes 10,100,1000] [--queries 50] [--seed 42] [--no-numpy]
+
+For each vocabulary size and maxDifference, this prints the time to build each
+matcher, the average time per query, the average fraction of the vocabulary
+whose Levenshtein distance the BK-tree calculated, and which matcher was
+faster. GestureMatcher uses its NumPy kernel if NumPy is installed, unless
+--no-numpy is given.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import moosegesture
+
+timer = getattr(time, 'perf_counter', time.time)
+
+DIRECTIONS = [moosegesture.UP, moosegesture.DOWN, moosegesture.LEFT, moosegesture.RIGHT,
+              moosegesture.UPLEFT, moosegesture.UPRIGHT, moosegesture.DOWNLEFT, moosegesture.DOWNRIGHT]
+
+
+def randomGesture(rng, minLen=1, maxLen=10):
+    return [rng.choice(DIRECTIONS) for i in range(rng.randint(minLen, maxLen))]
+
+
+def timeQueries(matcher, queries, maxDifference):
+    startTime = timer()
+    for strokes in queries:
+        matcher.match(strokes, maxDifference)
+    return timer() - startTime
+
+
+def countVisited(matcher, queries, maxDifference):
+    # The number of Levenshtein distances calculated for all the queries.
+    counts = [0, 0]
+    for strokes in queries:
+        matcher._closest(moosegesture._encodeGesture(strokes), maxDifference, counts)
+    return counts[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000,100000', help='comma-separated vocabulary sizes')
+    parser.add_argument('--queries', type=int, default=50, help='number of queries per vocabulary size')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-numpy', action='store_true', help="don't use GestureMatcher's NumPy kernel")
+    args = parser.parse_args()
+    if args.no_numpy:
+        moosegesture.GestureMatcher._numpyMinGestures = None
+    backend = 'python' if args.no_numpy or moosegesture.numpy is None else 'numpy'
+
+    rng = random.Random(args.seed)
+    print('GestureMatcher backend: %s' % (backend,))
+    print('%8s %8s %10s %10s %12s %12s %9s %8s' % ('size', 'maxDiff', 'build lin', 'build bk', 'query lin', 'query bk', 'visited', 'faster'))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        vocabulary = [randomGesture(rng) for i in range(size)]
+        queries = [randomGesture(rng) for i in range(args.queries)]
+
+        startTime = timer()
+        linear = moosegesture.GestureMatcher(vocabulary)
+        linearBuild = timer() - startTime
+        startTime = timer()
+        bkTree = moosegesture.BKTreeMatcher(vocabulary)
+        bkTreeBuild = timer() - startTime
+
+        for maxDifference in (1, 2, None):
+            linearTime = timeQueries(linear, queries, maxDifference)
+            bkTreeTime = timeQueries(bkTree, queries, maxDifference)
+            numVisited = countVisited(bkTree, queries, maxDifference)
+            print('%8d %8s %9.3fs %9.3fs %10.1fus %10.1fus %8.1f%% %8s' % (
+                size, maxDifference, linearBuild, bkTreeBuild,
+                linearTime / len(queries) * 1e6, bkTreeTime / len(queries) * 1e6,
+                100.0 * numVisited / (len(queries) * len(linear)),
+                'linear' if linearTime <= bkTreeTime else 'bk-tree'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Benchmarks gesture recognition and matching, and writes the results as JSON so
+they can be compared between commits.
+
+Usage:
+    python benchmarks/bench_suite.py [--output results.json] [--compare old.json]
+                                     [--max-ratio 1.25] [--quick] [--repeat 5] [--seed 42]
+
+The suite measures:
+
+- getGesture() throughput for traces from 10 to 100,000 points, with the pure
+  Python and (if installed) NumPy backends.
+- findClosestMatchingGesture() time for vocabularies from 10 to 10,000
+  gestures and queries of 1 to 12 strokes.
+- The peak memory allocated by a single call of each (with tracemalloc, on
+  Python 3 only).
+
+Each result is the best time of `--repeat` runs, since the best run is the
+one least disturbed by the rest of the machine. With `--compare`, every
+result is printed next to the matching result in an earlier JSON file along
+with the ratio of their times, and if `--max-ratio` is also given, the
+script exits with status 1 when any result is slower than that ratio.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import moosegesture
+
+timer = getattr(time, 'perf_counter', time.time) # Python 2 only has time.time()
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None # Python 2
+
+DIRECTIONS = [moosegesture.UP, moosegesture.DOWN, moosegesture.LEFT, moosegesture.RIGHT,
+              moosegesture.UPLEFT, moosegesture.UPRIGHT, moosegesture.DOWNLEFT, moosegesture.DOWNRIGHT]
+
+TRACE_LENGTHS = (10, 100, 1000, 10000, 100000)
+QUICK_TRACE_LENGTHS = (10, 100, 1000, 10000)
+VOCABULARY_SIZES = (10, 100, 1000, 10000)
+QUICK_VOCABULARY_SIZES = (10, 100, 1000)
+QUERY_LENGTHS = (1, 4, 12)
+
+# Each timed run repeats the call until it has taken at least this long, so
+# that calls on short traces are timed accurately.
+MIN_RUN_TIME = 0.05
+
+
+def randomTrace(rng, numPoints):
+    # A synthetic trace of random strokes, cut off at numPoints points.
+    gesture = []
+    while len(gesture) < numPoints // 10 + 1:
+        gesture.append(rng.choice([direction for direction in DIRECTIONS if not gesture or direction != gesture[-1]]))
+    return moosegesture.syntheticTrace(gesture, rng, jitter=1.0).points[:numPoints]
+
+
+def randomGesture(rng, length):
+    return [rng.choice(DIRECTIONS) for i in range(length)]
+
+
+def bestTime(func, repeat):
+    # Returns the best time for one call of `func` out of `repeat` runs.
+    number = 1
+    while True:
+        startTime = timer()
+        for i in range(number):
+            func()
+        elapsed = timer() - startTime
+        if elapsed >= MIN_RUN_TIME:
+            break
+        number *= 10
+    best = elapsed / number
+    for i in range(repeat - 1):
+        startTime = timer()
+        for j in range(number):
+            func()
+        best = min(best, (timer() - startTime) / number)
+    return best
+
+
+def peakMemory(func):
+    # Returns the peak number of bytes allocated during one call of `func`, or
+    # None if tracemalloc isn't available.
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchGetGesture(rng, traceLengths, repeat):
+    results = []
+    backends = [('python', False)]
+    if moosegesture.numpy is not None:
+        backends.append(('numpy', True))
+    for numPoints in traceLengths:
+        trace = randomTrace(rng, numPoints)
+        for backend, useNumpy in backends:
+            recognizer = moosegesture.GestureRecognizer(useNumpy=useNumpy)
+            if useNumpy:
+                # Lists this short would use the pure Python backend anyway.
+                points = moosegesture.numpy.array(trace)
+            else:
+                points = trace
+            func = lambda: recognizer.getGesture(points)
+            seconds = bestTime(func, repeat)
+            results.append({'benchmark': 'getGesture',
+                            'params': {'points': numPoints, 'backend': backend},
+                            'seconds': seconds,
+                            'pointsPerSecond': numPoints / seconds,
+                            'peakBytes': peakMemory(func)})
+    return results
+
+
+def benchFindClosest(rng, vocabularySizes, repeat):
+    results = []
+    for size in vocabularySizes:
+        vocabulary = [randomGesture(rng, rng.randint(1, 12)) for i in range(size)]
+        for queryLength in QUERY_LENGTHS:
+            queries = [randomGesture(rng, queryLength) for i in range(20)]
+
+            def func():
+                # The cache is cleared so that every query is calculated.
+                for strokes in queries:
+                    moosegesture.matchCache.clear()
+                    moosegesture.findClosestMatchingGesture(strokes, vocabulary)
+            moosegesture.findClosestMatchingGesture(queries[0], vocabulary) # build the matcher before timing
+            seconds = bestTime(func, repeat) / len(queries)
+            results.append({'benchmark': 'findClosestMatchingGesture',
+                            'params': {'gestures': size, 'queryLength': queryLength},
+                            'seconds': seconds,
+                            'peakBytes': peakMemory(lambda: moosegesture.findClosestMatchingGesture(queries[0], vocabulary))})
+    moosegesture.matchCache.clear()
+    return results
+
+
+def gitRevision():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                         stderr=open(os.devnull, 'w'))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('ascii').strip()
+
+
+def resultKey(result):
+    return (result['benchmark'], tuple(sorted(result['params'].items())))
+
+
+def printResults(results, baseline=None):
+    # Prints the results, and returns the largest ratio of a result's time
+    # to its baseline time (or None if there is no baseline).
+    largestRatio = None
+    baselineTimes = {}
+    if baseline is not None:
+        for result in baseline['results']:
+            baselineTimes[resultKey(result)] = result['seconds']
+
+    print('%-28s %-32s %12s %12s %12s %8s' % ('benchmark', 'params', 'time', 'peak mem', 'baseline', 'ratio'))
+    for result in results:
+        params = ' '.join(['%s=%s' % item for item in sorted(result['params'].items())])
+        peak = '-' if result['peakBytes'] is None else '%.1fKB' % (result['peakBytes'] / 1024.0)
+        line = '%-28s %-32s %10.1fus %12s' % (result['benchmark'], params, result['seconds'] * 1e6, peak)
+        baselineSeconds = baselineTimes.get(resultKey(result))
+        if baselineSeconds is not None:
+            ratio = result['seconds'] / baselineSeconds
+            largestRatio = ratio if largestRatio is None else max(largestRatio, ratio)
+            line += ' %10.1fus %7.2fx' % (baselineSeconds * 1e6, ratio)
+        print(line)
+    return largestRatio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='file to write the JSON results to')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--max-ratio', type=float, help='exit with status 1 if any result is slower than this ratio of --compare')
+    parser.add_argument('--quick', action='store_true', help='skip the largest traces and vocabularies')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs for each benchmark')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    results.extend(benchGetGesture(rng, QUICK_TRACE_LENGTHS if args.quick else TRACE_LENGTHS, args.repeat))
+    results.extend(benchFindClosest(rng, QUICK_VOCABULARY_SIZES if args.quick else VOCABULARY_SIZES, args.repeat))
+
+    report = {'revision': gitRevision(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'implementation': platform.python_implementation(),
+              'numpy': None if moosegesture.numpy is None else moosegesture.numpy.__version__,
+              'moosegesture': moosegesture.__version__,
+              'seed': args.seed,
+              'results': results}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    largestRatio = printResults(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.max_ratio is not None and largestRatio is not None and largestRatio > args.max_ratio:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
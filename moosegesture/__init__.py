@@ -15,6 +15,14 @@ correspond to the 8 cardinal and diagonal directions:
     'L' (left), 'R' (right)
     'DL' (down-left), 'D' (down), 'DR' (down-right)
 
+Directions can also be returned as small integer codes, which is how they
+are handled internally, by passing codes=True. The codes are laid out like a
+numeric keypad:
+
+    7 8 9      UL U UR
+    4   6  ->  L     R
+    1 2 3      DL D DR
+
 Second usage:
     strokes  = ['D', 'L', 'R']
     gestures = [['D', 'L', 'D'], ['D', 'R', 'UR']]
@@ -50,10 +58,28 @@ Explanation of the nomenclature in this module:
 
 __version__ = '1.0.2'
 
+import array
 import doctest
+import heapq
+import itertools
+import random
+import sys
+import threading
+import time
 
+from collections import namedtuple, OrderedDict
 from math import sqrt
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy is not None:
+    from . import _moosegesture_numpy
+else:
+    _moosegesture_numpy = None
+
 # This is the minimum distance the mouse must travel (in pixels) before a
 # segment will be considered for stroke interpretation.
 _MIN_STROKE_LEN = 60
@@ -67,15 +93,58 @@ UPLEFT = 'UL'
 UP = 'U'
 UPRIGHT = 'UR'
 
-def getGesture(points):
+# The directions for the integer codes that are used internally for stroke
+# identification and the Levenshtein distance kernels, laid out like a numeric
+# keypad. Code 0 (_NO_DIRECTION) is for point pairs with no direction.
+_NO_DIRECTION = 0
+_CODE_DIRECTIONS = (None, DOWNLEFT, DOWN, DOWNRIGHT, LEFT, None, RIGHT, UPLEFT, UP, UPRIGHT)
+_DIRECTION_CODES = dict((direction, code) for code, direction in enumerate(_CODE_DIRECTIONS) if direction is not None)
+# Maps both the direction strings and the direction codes to the codes, so
+# that gestures can be matched in either form.
+_ENCODED_DIRECTIONS = dict(_DIRECTION_CODES)
+_ENCODED_DIRECTIONS.update((code, code) for code in _DIRECTION_CODES.values())
+
+# Traces with fewer points than this use the pure Python stroke identification
+# even if NumPy is installed, since converting them to arrays costs more than
+# it saves.
+_NUMPY_MIN_POINTS = 128
+
+# GestureMatchers with at least this many gestures calculate the Levenshtein
+# distances to all of them at once with NumPy, if it is installed.
+_NUMPY_MIN_GESTURES = 32
+
+# The number of results findClosestMatchingGesture() keeps in matchCache.
+_MATCH_CACHE_SIZE = 1024
+
+# The RecognitionStats that stroke identification and matching record their
+# work in, or None if stats are disabled. See `enableStats()`.
+_stats = None
+
+_timer = getattr(time, 'perf_counter', time.time) # time.perf_counter() isn't in Python 2
+_clock = getattr(time, 'monotonic', time.time) # neither is time.monotonic()
+
+# MultiStreamRecognizers compact their point arrays once they have at least
+# this many points and most of them belong to streams that have ended.
+_MULTI_STREAM_COMPACT_MIN = 4096
+
+# Whole numbers below this are exactly representable as floats, so sums of
+# whole-number distances below it have no rounding error.
+_MAX_EXACT_FLOAT = 2 ** 53
+
+def getGesture(points, codes=False):
     """
     Returns a gesture as a list of directions, i.e. ['U', 'DL'] for
     the down-left-right gesture.
 
     The `points` parameter is a list of (x, y) tuples of points that make up
-    the user's mouse gesture.
+    the user's mouse gesture. It can also be an array.array, memoryview,
+    NumPy array, or other buffer of interleaved x and y values (either flat
+    or in N rows of 2), which is read without converting it to tuples.
+
+    If `codes` is True, the directions are returned as integer codes instead
+    of strings, i.e. [8, 1] for ['U', 'DL'] (see `codesToDirections()`).
     """
-    return _identifyStrokes(points)[0]
+    return _defaultRecognizer().getGesture(points, codes)
 
 
 def getSegments(points):
@@ -83,17 +152,860 @@ def getSegments(points):
     Returns a list of tuples of integers. The tuples are the start and end
     indexes of the points that make up a consistent stroke.
     """
-    return _identifyStrokes(points)[1]
+    return _defaultRecognizer().getSegments(points)
+
+
+def getGestureAndSegments(points, codes=False):
+    """
+    Returns a list of tuples. The first item in the tuple is the direction
+    (or its integer code, if `codes` is True), and the second item is a list
+    of integers for the start and end indexes of the points that make up the
+    stroke.
+    """
+    return _defaultRecognizer().getGestureAndSegments(points, codes)
+
+
+def getGestures(traces, workers=None, chunksize=None, codes=False):
+    """
+    Returns a list of gestures for each trace in `traces`, in the same order.
+    Each trace is a list of (x, y) tuples, the same as the `points` parameter
+    of `getGesture()`.
+
+    The traces are recognized in a pool of `workers` processes (by default, one
+    per CPU). They are sent to the workers in chunks of `chunksize` traces,
+    with each chunk's coordinates packed into a single array so that pickling
+    them is cheap. If `workers` is 1, the traces are recognized in this
+    process instead. If `codes` is True, the gestures are lists of integer
+    direction codes.
+    """
+    return _defaultRecognizer().getGestures(traces, workers, chunksize, codes)
+
+
+def codesToDirections(codes):
+    """
+    Returns a list of the direction strings for the integer direction codes
+    in `codes`, i.e. ['U', 'DL'] for [8, 1].
+    """
+    return [_CODE_DIRECTIONS[code] for code in codes]
+
+
+def directionsToCodes(directions):
+    """
+    Returns a list of the integer direction codes for the direction strings
+    in `directions`, i.e. [8, 1] for ['U', 'DL'].
+    """
+    return [_DIRECTION_CODES[direction] for direction in directions]
+
+
+def enableStats(callback=None):
+    """
+    Starts recording the work done by stroke identification and gesture
+    matching in a new RecognitionStats object, and returns it. If `callback`
+    is given, it is also called after every recorded call (see
+    RecognitionStats). While stats are disabled (the default), recording
+    them costs a single check per call.
+    """
+    global _stats
+    _stats = RecognitionStats(callback)
+    return _stats
+
+
+def disableStats():
+    """
+    Stops recording stats, and returns the RecognitionStats that they were
+    recorded in (or None if they weren't being recorded).
+    """
+    global _stats
+    stats = _stats
+    _stats = None
+    return stats
+
+
+class RecognitionStats(object):
+    """
+    The times and counts of the work done by stroke identification (for every
+    getGesture()-like call) and by `findClosestMatchingGesture()` and
+    `GestureMatcher.match()`, while stats are enabled with `enableStats()`.
+
+    `calls` has the number of 'identifyStrokes', 'match', 'findWithin' and
+    'kClosest' calls (`findClosestMatchingGesture()` and
+    `findKClosestGestures()` count as 'match' and 'kClosest'), and
+    `seconds` has the total time spent in each stage:
+
+    - 'distance': calculating the length of each point pair
+    - 'direction': calculating the direction of each point pair
+    - 'segmentation': checking the windows of point pairs for strokes
+    - 'matching': finding the closest gestures, including cache lookups
+
+    Reading or converting the points isn't included in any stage. `counts`
+    has the total number of points processed ('points'), point pair
+    directions calculated ('directions'), windows checked ('windows'),
+    Levenshtein distances calculated ('levenshteinDistances'), and the
+    Levenshtein matrix cells actually calculated ('levenshteinCells'). The
+    bounded kernels only calculate the cells in their band, and the NumPy
+    kernel also calculates the cells of the padding of shorter gestures.
+
+    If `callback` is given, it is called as callback(operation, seconds,
+    counts) after every call, with the operation's name (one of the `calls`
+    keys) and dicts of that call's stage times and counts, for example to
+    log slow calls.
+    """
+    def __init__(self, callback=None):
+        self._lock = threading.Lock()
+        self.callback = callback
+        self.reset()
+
+
+    def __repr__(self):
+        return '%s(calls=%r, seconds=%r, counts=%r)' % (self.__class__.__name__, self.calls, self.seconds, self.counts)
+
+
+    def reset(self):
+        """
+        Sets all the times and counts back to zero.
+        """
+        with self._lock:
+            self.calls = {'identifyStrokes': 0, 'match': 0, 'findWithin': 0, 'kClosest': 0}
+            self.seconds = {'distance': 0.0, 'direction': 0.0, 'segmentation': 0.0, 'matching': 0.0}
+            self.counts = {'points': 0, 'directions': 0, 'windows': 0, 'levenshteinDistances': 0, 'levenshteinCells': 0}
+
+
+    def _record(self, operation, seconds, counts):
+        """
+        Adds the stage times in the `seconds` dict and the `counts` of one
+        call of `operation`.
+        """
+        with self._lock:
+            self.calls[operation] += 1
+            for stage in seconds:
+                self.seconds[stage] += seconds[stage]
+            for name in counts:
+                self.counts[name] += counts[name]
+        if self.callback is not None:
+            self.callback(operation, seconds, counts)
+
+
+class GestureRecognizer(object):
+    """
+    Recognizes gestures with its own settings instead of the module-level
+    _MIN_STROKE_LEN. The settings can't be changed after the recognizer is
+    created, and recognizing a gesture doesn't modify the recognizer, so one
+    recognizer can be used by many threads at the same time.
+
+    The `minStrokeLen` is the minimum distance (in pixels) the mouse must
+    travel before a segment will be considered for stroke interpretation (by
+    default, the current value of _MIN_STROKE_LEN). If `useNumpy` is False,
+    the NumPy backend isn't used even if it's installed.
+
+    If `minPointDistance` is given, the points are decimated before strokes
+    are identified: each point that is not farther than `minPointDistance`
+    from the last kept point is dropped. The segments still have the indexes
+    of the original points. This is meant for high-rate pointing devices
+    that report thousands of tiny or repeated moves per gesture:
+
+    - With a `minPointDistance` of 0, only repeated points are dropped. For
+      traces without repeated points, the result is exactly the same as
+      without decimation. A repeated point in the middle of a stroke keeps
+      the undecimated recognizer from seeing a consistent direction there,
+      so with them dropped, strokes drawn with pauses can be recognized
+      that otherwise wouldn't be.
+    - Larger distances resample the trace, and the result only approximates
+      the undecimated one. Keep `minPointDistance` well under `minStrokeLen`
+      (a quarter of it or less) so that each stroke still spans several
+      point pairs.
+    """
+    __slots__ = ('_minStrokeLen', '_numpyMinPoints', '_minPointDistance')
+
+    def __init__(self, minStrokeLen=None, useNumpy=True, minPointDistance=None):
+        if minStrokeLen is None:
+            minStrokeLen = _MIN_STROKE_LEN
+        object.__setattr__(self, '_minStrokeLen', minStrokeLen)
+        object.__setattr__(self, '_minPointDistance', minPointDistance)
+        if useNumpy and _moosegesture_numpy is not None:
+            object.__setattr__(self, '_numpyMinPoints', _NUMPY_MIN_POINTS)
+        else:
+            object.__setattr__(self, '_numpyMinPoints', None)
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError('GestureRecognizer objects are immutable')
+
+
+    def __repr__(self):
+        return '%s(minStrokeLen=%r, useNumpy=%r, minPointDistance=%r)' % (self.__class__.__name__, self._minStrokeLen,
+                                                                         self.useNumpy, self._minPointDistance)
+
+
+    @property
+    def minStrokeLen(self):
+        """The minimum distance the mouse must travel for a stroke."""
+        return self._minStrokeLen
+
+
+    @property
+    def useNumpy(self):
+        """True if the NumPy backend is used for long traces."""
+        return self._numpyMinPoints is not None
+
+
+    @property
+    def minPointDistance(self):
+        """The distance points are decimated by, or None if they aren't."""
+        return self._minPointDistance
+
+
+    def _identifyStrokes(self, points):
+        """
+        Returns the (strokes, strokeSegments) tuple for `points` using this
+        recognizer's settings, with the strokes as direction codes.
+        """
+        if self._minPointDistance is None:
+            return _identifyStrokes(points, self._minStrokeLen, self._numpyMinPoints)
+        xs, ys = _pointCoordinates(points)
+        kept = _decimatePoints(xs, ys, self._minPointDistance)
+        if _moosegesture_numpy is not None and self._numpyMinPoints is not None and len(kept) >= self._numpyMinPoints:
+            strokes, strokeSegments = _identifyStrokesArray(_moosegesture_numpy.pointArray(points)[kept], self._minStrokeLen)
+        else:
+            strokes, strokeSegments = _identifyStrokesCoordinates([xs[i] for i in kept], [ys[i] for i in kept], self._minStrokeLen)
+        return strokes, _undecimateSegments(strokeSegments, kept)
+
+
+    def getGesture(self, points, codes=False):
+        """
+        Returns a gesture as a list of directions, the same as the module-level
+        `getGesture()` function.
+        """
+        strokes = self._identifyStrokes(points)[0]
+        if codes:
+            return strokes
+        return [_CODE_DIRECTIONS[code] for code in strokes]
+
+
+    def getSegments(self, points):
+        """
+        Returns a list of [start, end] point indexes for each stroke, the same
+        as the module-level `getSegments()` function.
+        """
+        return self._identifyStrokes(points)[1]
+
+
+    def getGestureAndSegments(self, points, codes=False):
+        """
+        Returns a list of (direction, [start, end]) tuples for each stroke, the
+        same as the module-level `getGestureAndSegments()` function.
+        """
+        strokes, strokeSegments = self._identifyStrokes(points)
+        if not codes:
+            strokes = [_CODE_DIRECTIONS[code] for code in strokes]
+        return list(zip(strokes, strokeSegments))
+
+
+    def getGestures(self, traces, workers=None, chunksize=None, codes=False):
+        """
+        Returns a list of gestures for each trace in `traces`, the same as the
+        module-level `getGestures()` function.
+        """
+        traces = list(traces)
+        if workers is None:
+            import multiprocessing
+            workers = multiprocessing.cpu_count()
+        if workers <= 1 or len(traces) <= 1:
+            return [self.getGesture(trace, codes) for trace in traces]
+
+        if chunksize is None:
+            # Several chunks per worker keeps them all busy when some traces
+            # are much longer than others.
+            chunksize = max(1, min(1000, len(traces) // (workers * 4)))
+
+        chunks = []
+        for i in range(0, len(traces), chunksize):
+            chunks.append((self,) + _packTraces(traces[i:i + chunksize]))
+
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        try:
+            gestures = []
+            for chunkGestures in pool.imap(_getGesturesChunk, chunks):
+                for gestureCodes in chunkGestures:
+                    if codes:
+                        gestures.append(list(bytearray(gestureCodes)))
+                    else:
+                        gestures.append([_CODE_DIRECTIONS[code] for code in bytearray(gestureCodes)])
+        finally:
+            pool.close()
+            pool.join()
+        return gestures
+
+
+    def strokeRecognizer(self, onStrokeStart=None, onStrokeExtended=None, onStrokeEnd=None):
+        """
+        Returns a new StrokeRecognizer that uses this recognizer's settings,
+        with the given stroke callbacks.
+        """
+        return StrokeRecognizer(minStrokeLen=self._minStrokeLen, minPointDistance=self._minPointDistance,
+                                onStrokeStart=onStrokeStart, onStrokeExtended=onStrokeExtended, onStrokeEnd=onStrokeEnd)
+
+
+    def __reduce__(self):
+        return (GestureRecognizer, (self._minStrokeLen, self.useNumpy, self._minPointDistance))
+
+
+def _decimatePoints(xs, ys, minPointDistance):
+    """
+    Returns a list of the indexes of the points to keep, where `xs` and `ys`
+    are the points' coordinates. The first point is kept, and then each point
+    farther than `minPointDistance` from the last kept point.
+    """
+    if not len(xs):
+        return []
+    kept = [0]
+    lastX, lastY = xs[0], ys[0]
+    limit = minPointDistance * minPointDistance
+    for i in range(1, len(xs)):
+        x, y = xs[i], ys[i]
+        xdist = x - lastX
+        ydist = y - lastY
+        if xdist*xdist + ydist*ydist > limit:
+            kept.append(i)
+            lastX, lastY = x, y
+    return kept
+
+
+def _undecimateSegments(strokeSegments, kept):
+    """
+    Returns the [start, end] point pair indexes in `strokeSegments` (which
+    are for the decimated points) as indexes into the original points, where
+    `kept` is the list of the original indexes of the decimated points.
+    """
+    # A decimated point pair goes from kept[i] to kept[i+1], which covers the
+    # original point pairs kept[i] up to kept[i+1] - 1.
+    return [[kept[start], kept[end + 1] - 1] for start, end in strokeSegments]
+
+
+_defaultGestureRecognizer = None
+
+def _defaultRecognizer():
+    """
+    Returns the GestureRecognizer used by the module-level functions. A new one
+    is created whenever _MIN_STROKE_LEN has been changed.
+    """
+    global _defaultGestureRecognizer
+    recognizer = _defaultGestureRecognizer
+    if recognizer is None or recognizer.minStrokeLen != _MIN_STROKE_LEN:
+        recognizer = _defaultGestureRecognizer = GestureRecognizer(_MIN_STROKE_LEN)
+    return recognizer
+
+
+def _packTraces(traces):
+    """
+    Returns a (coordinates, offsets) tuple of array.arrays for the list of
+    traces in `traces`. The x and y values of all the points are interleaved in
+    `coordinates`, and trace i's points are from point offsets[i] up to (but
+    not including) point offsets[i+1].
+    """
+    coordinates = array.array('d')
+    offsets = array.array('l', [0])
+    for trace in traces:
+        if isinstance(trace, (list, tuple)):
+            coordinates.extend(itertools.chain.from_iterable(trace))
+            offsets.append(offsets[-1] + len(trace))
+        else:
+            xs, ys = _pointCoordinates(trace)
+            coordinates.extend(itertools.chain.from_iterable(zip(xs, ys)))
+            offsets.append(offsets[-1] + len(xs))
+    return coordinates, offsets
+
+
+def _getGesturesChunk(chunk):
+    """
+    Returns the list of gestures for a chunk of traces packed by
+    `_packTraces()`. This runs in the worker processes of `getGestures()`.
+    Each gesture is returned as a bytes object of direction codes, which is
+    much cheaper to send back than a list of strings.
+    """
+    recognizer, coordinates, offsets = chunk
+    coordinates = memoryview(coordinates)
+    gestures = []
+    for i in range(len(offsets) - 1):
+        gestures.append(bytes(bytearray(recognizer.getGesture(coordinates[2 * offsets[i]:2 * offsets[i + 1]], codes=True))))
+    return gestures
+
+
+class StrokeRecognizer(object):
+    """
+    Identifies strokes from points that are added one at a time, such as from
+    live mouse movement events. After each call to `addPoint()`, the `strokes`
+    and `segments` attributes are the same as what `getGesture()` and
+    `getSegments()` would return for all of the points added so far.
+
+    Each new point only does a constant amount of work (amortized), instead of
+    rescanning every previous point the way calling `getGesture()` every
+    frame would.
+
+    The `minStrokeLen` is the minimum stroke distance to use instead of
+    _MIN_STROKE_LEN. If `minPointDistance` is given, the points are decimated
+    the same way as GestureRecognizer does.
+
+    The `onStrokeStart`, `onStrokeExtended`, and `onStrokeEnd` callbacks are
+    called with the (direction, [start, end]) of a stroke as soon as
+    `addPoint()` recognizes it, lengthens its segment, or starts the next
+    stroke after it. Call `finish()` when the gesture is done (i.e. the mouse
+    button is released) to end the last stroke. The segments are the same as
+    `segments` has at that moment, so an app can react to the first
+    recognized direction without checking `strokes` after every point.
+    """
+    def __init__(self, points=(), minStrokeLen=None, minPointDistance=None,
+                 onStrokeStart=None, onStrokeExtended=None, onStrokeEnd=None):
+        if minStrokeLen is None:
+            minStrokeLen = _MIN_STROKE_LEN
+        self._minStrokeLen = minStrokeLen
+        self._minPointDistance = minPointDistance
+        self.onStrokeStart = onStrokeStart
+        self.onStrokeExtended = onStrokeExtended
+        self.onStrokeEnd = onStrokeEnd
+        self.reset()
+        for x, y in points:
+            self.addPoint(x, y)
+
+
+    def reset(self):
+        """
+        Forgets all the points that have been added, so that a new gesture can
+        be recognized.
+        """
+        self._lastPoint = None
+        self._numPoints = 0 # the number of points kept after decimation
+        self._numAdded = 0 # the number of points added, including dropped points
+        self._keptIndexes = [] if self._minPointDistance is not None else None
+        self._distances = [] # the distances of each point pair
+        self._prefixDistances = [0.0] # _prefixDistances[i] is the sum of _distances[:i]
+        self._directions = [] # the direction code of each point pair
+        self._runStarts = [] # the index of the first point pair in the run of same directions ending at each point pair
+        self._nextStart = 0 # the first segment start whose window hasn't reached minStrokeLen yet
+        self._sequentialDist = None # the _nextStart window's distances added up one at a time, if they had to be
+        self._exact = True # True while all the distances are whole numbers with an exact sum
+        self._strokes = [] # the direction codes of the strokes
+        self._strokeSegments = []
+        self._numStarted = 0 # the number of strokes onStrokeStart has been called for
+        self._numEnded = 0 # the number of strokes onStrokeEnd has been called for
+        self._lastEnd = None # the end of the latest stroke's segment when onStrokeExtended was last called
+
+
+    def addPoint(self, x, y):
+        """
+        Adds the (x, y) point to the end of the gesture being recognized.
+        """
+        point = (x, y)
+        if self._keptIndexes is not None:
+            if self._lastPoint is not None:
+                xdist = x - self._lastPoint[0]
+                ydist = y - self._lastPoint[1]
+                if xdist*xdist + ydist*ydist <= self._minPointDistance * self._minPointDistance:
+                    self._numAdded += 1
+                    return # drop the point, the same as _decimatePoints() does
+            self._keptIndexes.append(self._numAdded)
+        self._numAdded += 1
+
+        if self._lastPoint is not None:
+            i = len(self._distances)
+            dist = _distance(self._lastPoint, point)
+            direction = _directionCode(x - self._lastPoint[0], y - self._lastPoint[1])
+            self._distances.append(dist)
+            self._prefixDistances.append(self._prefixDistances[-1] + dist)
+            if self._exact and not (dist.is_integer() and self._prefixDistances[-1] < _MAX_EXACT_FLOAT):
+                self._exact = False
+            self._directions.append(direction)
+            if i > 0 and self._directions[i - 1] == direction:
+                self._runStarts.append(self._runStarts[i - 1])
+            else:
+                self._runStarts.append(i)
+
+            # Each segment start only has its window checked until it first
+            # reaches minStrokeLen, and windows can only reach it in order.
+            while self._nextStart <= i:
+                reached, self._sequentialDist = _windowReachesMinLen(self._distances, self._prefixDistances, self._nextStart, i,
+                                                                     self._minStrokeLen, self._exact, self._sequentialDist)
+                if not reached:
+                    break
+                _updateStrokes(self._strokes, self._strokeSegments, self._nextStart, i,
+                               *_windowDirection(self._directions, self._runStarts, self._nextStart, i - 1))
+                self._nextStart += 1
+                self._sequentialDist = None
+        self._lastPoint = point
+        self._numPoints += 1
+        if self.onStrokeStart is not None or self.onStrokeExtended is not None or self.onStrokeEnd is not None:
+            self._strokeEvents()
+
+
+    def finish(self):
+        """
+        Ends the last stroke, calling onStrokeEnd for it if it hasn't been
+        called yet. No more points should be added until `reset()` is called.
+        """
+        if self._numEnded < len(self._strokes):
+            self._endStroke(len(self._strokes) - 1)
+
+
+    def _strokeEvents(self):
+        """
+        Calls the callbacks for the strokes that the last added point started
+        or lengthened.
+        """
+        numStrokes = len(self._strokes)
+        if self._numStarted < numStrokes:
+            while self._numStarted < numStrokes:
+                if self._numStarted > 0:
+                    self._endStroke(self._numStarted - 1)
+                direction, segment = self._stroke(self._numStarted)
+                self._numStarted += 1
+                self._lastEnd = segment[1]
+                if self.onStrokeStart is not None:
+                    self.onStrokeStart(direction, segment)
+        elif numStrokes and self._numEnded < numStrokes and self.onStrokeExtended is not None:
+            direction, segment = self._stroke(numStrokes - 1)
+            if segment[1] != self._lastEnd:
+                self._lastEnd = segment[1]
+                self.onStrokeExtended(direction, segment)
+
+
+    def _endStroke(self, i):
+        """
+        Calls onStrokeEnd for stroke `i` if it hasn't been called for it yet.
+        """
+        if i >= self._numEnded:
+            self._numEnded = i + 1
+            if self.onStrokeEnd is not None:
+                self.onStrokeEnd(*self._stroke(i))
+
+
+    @property
+    def strokes(self):
+        """
+        The list of directions recognized so far, the same as `getGesture()`
+        would return.
+        """
+        return [_CODE_DIRECTIONS[code] for code in self._strokes]
+
+
+    @property
+    def strokeCodes(self):
+        """
+        The list of integer direction codes of the strokes recognized so far,
+        the same as `getGesture(points, codes=True)` would return.
+        """
+        return list(self._strokes)
+
+
+    @property
+    def segments(self):
+        """
+        The list of [start, end] point indexes for each stroke recognized so
+        far, the same as `getSegments()` would return.
+        """
+        segments = [list(segment) for segment in self._strokeSegments]
+        if segments and self._nextStart <= self._numPoints - 2:
+            # The segment starts whose windows never reached minStrokeLen
+            # lengthen the latest stroke up to the last point pair.
+            segments[-1][1] = self._numPoints - 2
+        if self._keptIndexes is not None:
+            segments = _undecimateSegments(segments, self._keptIndexes)
+        return segments
+
+
+    def _stroke(self, i, codes=False):
+        """
+        Returns the (direction, [start, end]) tuple of stroke `i`, with the
+        direction as an integer code if `codes` is True. Only the latest
+        stroke's segment can still change as points are added.
+        """
+        segment = list(self._strokeSegments[i])
+        if i == len(self._strokeSegments) - 1 and self._nextStart <= self._numPoints - 2:
+            segment[1] = self._numPoints - 2 # the same as in `segments`
+        if self._keptIndexes is not None:
+            segment = _undecimateSegments([segment], self._keptIndexes)[0]
+        direction = self._strokes[i]
+        if not codes:
+            direction = _CODE_DIRECTIONS[direction]
+        return direction, segment
+
+
+def _windowReachesMinLen(distances, prefixDistances, start, end, minStrokeLen, exact=False, sequentialDist=None):
+    """
+    Returns a (reached, sequentialDist) tuple of whether the sum of
+    `distances[start:end+1]` (added up one at a time, the way
+    `_identifyStrokes` does it) is at least `minStrokeLen`, and that sum if it
+    had to be added up one at a time (or else None).
+
+    If `exact` is True, the prefix sums have no rounding error and are always
+    trusted. Pass the `sequentialDist` returned for the window with the same
+    start that ends at `end - 1` so that it is lengthened instead of being
+    added up again.
+    """
+    if sequentialDist is not None:
+        sequentialDist += distances[end]
+        return sequentialDist >= minStrokeLen, sequentialDist
+    segmentDist = prefixDistances[end + 1] - prefixDistances[start]
+    if exact:
+        return segmentDist >= minStrokeLen, None
+    # The prefix sums can round differently than adding up the window, so
+    # only trust them when they aren't close to minStrokeLen.
+    tolerance = 4 * (end + 2) * sys.float_info.epsilon * prefixDistances[end + 1]
+    if abs(segmentDist - minStrokeLen) > tolerance:
+        return segmentDist >= minStrokeLen, None
+    sequentialDist = 0
+    for i in range(start, end + 1):
+        sequentialDist += distances[i]
+    return sequentialDist >= minStrokeLen, sequentialDist
+
+
+def _exactDistances(distances, total):
+    """
+    Returns True if all the `distances` are whole numbers and their `total`
+    is small enough that every sum of them is exact, so that prefix sums can
+    be subtracted without any rounding error. (This is the usual case for
+    integer traces of axis-aligned moves.)
+    """
+    return total < _MAX_EXACT_FLOAT and all(dist.is_integer() for dist in distances)
+
+
+def _windowDirection(directions, runStarts, start, last):
+    """
+    Returns a (consistent, direction) tuple for the point pairs from `start`
+    to `last` (inclusive), the same way `_identifyStrokes` checks if all the
+    point pairs in a window are going the same direction. Point pairs with no
+    direction (i.e. duplicate points) at the start of the window are ignored.
+    The direction is a direction code, which is _NO_DIRECTION if the window
+    doesn't have one.
+    """
+    if last < start:
+        return True, _NO_DIRECTION # the window is a single point pair, so no directions are checked
+    direction = directions[last]
+    runStart = runStarts[last]
+    if runStart <= start:
+        return True, direction
+    if direction != _NO_DIRECTION and directions[runStart - 1] == _NO_DIRECTION and runStarts[runStart - 1] <= start:
+        return True, direction
+    return False, _NO_DIRECTION
+
+
+def _updateStrokes(strokes, strokeSegments, startSegPoint, curSegPoint, consistent, direction):
+    """
+    Adds a new stroke or lengthens the latest stroke in `strokes` and
+    `strokeSegments` for the window from `startSegPoint` to `curSegPoint`.
+    """
+    if not consistent:
+        return
+    elif direction != _NO_DIRECTION and (not strokes or strokes[-1] != direction):
+        strokes.append(direction)
+        strokeSegments.append([startSegPoint, curSegPoint])
+    elif strokeSegments:
+        # update and lengthen the latest stroke since this stroke is being lengthened.
+        strokeSegments[-1][1] = curSegPoint
 
 
-def getGestureAndSegments(points):
+class MultiStreamRecognizer(object):
     """
-    Returns a list of tuples. The first item in the tuple is the directional
-    integer, and the second item is a tuple of integers for the start and end
-    indexes of the points that make up the stroke.
+    Recognizes the gestures of many pointer streams at once, such as the
+    mouse movements of thousands of client sessions on a server. Events are
+    added in bulk as (streamId, x, y) tuples, and a stream's gesture is
+    recognized when it ends, either by calling `endStream()` or by the
+    stream being idle for more than `idleTimeout` seconds.
+
+    Instead of a list of point tuples for each stream, the points of every
+    stream are appended to shared arrays of x and y coordinates, with each
+    point linked to the next point of the same stream. The state of each
+    stream (its first and last point, number of points, and when it was last
+    seen) is kept in arrays indexed by a slot number, and the slots of ended
+    streams are reused. The point arrays are compacted once most of their
+    points belong to ended streams. This takes about 24 bytes per point and
+    40 bytes per stream, plus the dict entry for the stream's ID.
+
+    The gestures are recognized by the GestureRecognizer `recognizer` (by
+    default, with the same settings as `getGesture()`), and are lists of
+    integer direction codes if `codes` is True. The `clock` returns the time
+    in seconds used for the idle timeouts (by default, time.monotonic() where
+    it is available).
     """
-    strokes, strokeSegments = _identifyStrokes(points)
-    return list(zip(strokes, strokeSegments))
+    _compactMinPoints = _MULTI_STREAM_COMPACT_MIN
+
+    def __init__(self, recognizer=None, idleTimeout=30.0, codes=False, clock=None):
+        if recognizer is None:
+            recognizer = _defaultRecognizer()
+        self._recognizer = recognizer
+        self._idleTimeout = idleTimeout
+        self._codes = codes
+        self._clock = clock if clock is not None else _clock
+
+        self._slots = {} # stream ID -> slot
+        self._slotStreamIds = [] # slot -> stream ID, or _FREE_SLOT
+        self._freeSlots = []
+        self._heads = array.array('l') # the index of each slot's first point
+        self._tails = array.array('l') # the index of each slot's last point
+        self._counts = array.array('l') # the number of points in each slot
+        self._lastSeen = array.array('d') # the time of each slot's last event
+
+        self._xs = array.array('d')
+        self._ys = array.array('d')
+        self._nexts = array.array('l') # the index of the next point in the same stream, or -1
+        self._numLivePoints = 0 # the number of points that belong to streams that haven't ended
+        self._lastEvictionCheck = None
+
+
+    def __len__(self):
+        return len(self._slots)
+
+
+    def __contains__(self, streamId):
+        return streamId in self._slots
+
+
+    def addEvents(self, events, now=None):
+        """
+        Adds the points of the (streamId, x, y) tuples in `events` to the end
+        of their streams, all at the time `now` (by default, the current time
+        of the clock). Returns a dict of the gestures of the streams that were
+        idle for more than idleTimeout, keyed by stream ID. An event for an
+        idle stream ends its gesture and starts a new one.
+        """
+        if now is None:
+            now = self._clock()
+        finished = {}
+        slots = self._slots
+        tails = self._tails
+        counts = self._counts
+        lastSeen = self._lastSeen
+        xs = self._xs
+        ys = self._ys
+        nexts = self._nexts
+        idleTimeout = self._idleTimeout
+        numAdded = 0
+        for streamId, x, y in events:
+            slot = slots.get(streamId)
+            if slot is None:
+                slot = self._newSlot(streamId)
+            elif now - lastSeen[slot] > idleTimeout:
+                finished[streamId] = self._endSlot(slot)
+                slot = self._newSlot(streamId)
+            index = len(xs)
+            xs.append(x)
+            ys.append(y)
+            nexts.append(-1)
+            if counts[slot]:
+                nexts[tails[slot]] = index
+            else:
+                self._heads[slot] = index
+            tails[slot] = index
+            counts[slot] += 1
+            lastSeen[slot] = now
+            numAdded += 1
+        self._numLivePoints += numAdded
+
+        # Streams without any new events are only checked for being idle a
+        # few times per idleTimeout, since that loops over all of them.
+        if self._lastEvictionCheck is None:
+            self._lastEvictionCheck = now
+        elif now - self._lastEvictionCheck >= idleTimeout / 4.0:
+            finished.update(self.evictIdle(now))
+        self._compactIfSparse()
+        return finished
+
+
+    def endStream(self, streamId):
+        """
+        Ends the stream and returns its gesture, or returns None if there is
+        no stream with the ID `streamId`.
+        """
+        slot = self._slots.get(streamId)
+        if slot is None:
+            return None
+        gesture = self._endSlot(slot)
+        self._compactIfSparse()
+        return gesture
+
+
+    def evictIdle(self, now=None):
+        """
+        Ends every stream that has been idle for more than idleTimeout, and
+        returns a dict of their gestures keyed by stream ID.
+        """
+        if now is None:
+            now = self._clock()
+        self._lastEvictionCheck = now
+        finished = {}
+        lastSeen = self._lastSeen
+        for slot in range(len(self._slotStreamIds)):
+            streamId = self._slotStreamIds[slot]
+            if streamId is not _FREE_SLOT and now - lastSeen[slot] > self._idleTimeout:
+                finished[streamId] = self._endSlot(slot)
+        self._compactIfSparse()
+        return finished
+
+
+    def _newSlot(self, streamId):
+        """
+        Returns a slot for a new stream, reusing a free slot if there is one.
+        """
+        if self._freeSlots:
+            slot = self._freeSlots.pop()
+            self._slotStreamIds[slot] = streamId
+            self._counts[slot] = 0
+        else:
+            slot = len(self._slotStreamIds)
+            self._slotStreamIds.append(streamId)
+            self._heads.append(-1)
+            self._tails.append(-1)
+            self._counts.append(0)
+            self._lastSeen.append(0.0)
+        self._slots[streamId] = slot
+        return slot
+
+
+    def _endSlot(self, slot):
+        """
+        Frees the slot and returns the gesture of its stream's points.
+        """
+        points = array.array('d')
+        xs = self._xs
+        ys = self._ys
+        nexts = self._nexts
+        i = self._heads[slot]
+        while i != -1:
+            points.append(xs[i])
+            points.append(ys[i])
+            i = nexts[i]
+        self._numLivePoints -= self._counts[slot]
+        del self._slots[self._slotStreamIds[slot]]
+        self._slotStreamIds[slot] = _FREE_SLOT
+        self._freeSlots.append(slot)
+        return self._recognizer.getGesture(points, self._codes)
+
+
+    def _compactIfSparse(self):
+        """
+        Copies the points of the streams that haven't ended into new arrays if
+        most of the points belong to streams that have.
+        """
+        if len(self._xs) < self._compactMinPoints or len(self._xs) < 2 * self._numLivePoints:
+            return
+        xs = array.array('d')
+        ys = array.array('d')
+        nexts = array.array('l')
+        for slot in self._slots.values():
+            i = self._heads[slot]
+            self._heads[slot] = len(xs)
+            while i != -1:
+                xs.append(self._xs[i])
+                ys.append(self._ys[i])
+                nexts.append(len(nexts) + 1)
+                i = self._nexts[i]
+            nexts[-1] = -1
+            self._tails[slot] = len(xs) - 1
+        self._xs = xs
+        self._ys = ys
+        self._nexts = nexts
+
+
+_FREE_SLOT = object() # a sentinel, since None is a valid stream ID
 
 
 def findClosestMatchingGesture(strokes, gestureList, maxDifference=None):
@@ -101,26 +1013,726 @@ def findClosestMatchingGesture(strokes, gestureList, maxDifference=None):
     Returns the gesture(s) in `gestureList` that closest matches the gesture in
     `strokes`. The `maxDifference` is how many differences there can be and still
     be considered a match.
+
+    The gestures are prepared once for each vocabulary (for the last few
+    vocabularies passed in) and results are kept in the `matchCache` LRU
+    cache. Any change to the gestures in `gestureList` is noticed, and a new
+    list with the same gestures reuses the same prepared gestures and cached
+    results.
+    """
+    return _matcherFor(gestureList).match(strokes, maxDifference)
+
+
+def findKClosestGestures(strokes, gestureList, k, maxDifference=None):
+    """
+    Returns a list of up to `k` (distance, gesture) tuples for the gestures in
+    `gestureList` closest to `strokes`, closest first. Gestures with the same
+    distance are in the order they are in `gestureList`. Gestures more than
+    `maxDifference` away are left out.
+
+    This is useful for showing "did you mean" alternatives to the closest
+    matching gesture.
+    """
+    return _matcherFor(gestureList).kClosest(strokes, k, maxDifference)
+
+
+def _matcherFor(gestureList):
+    """
+    Returns the GestureMatcher for the gestures in `gestureList`. A matcher is
+    kept for each of the last _MATCHERS_SIZE gesture lists passed in. It is
+    reused for as long as the same list holds the same gestures, which is
+    checked against a copy of each gesture, so a gesture that is changed in
+    place gets a new matcher. A new list of the same gestures as one of the
+    other lists reuses its matcher.
+    """
+    gestures = gestureList if isinstance(gestureList, list) else list(gestureList)
+    key = id(gestureList)
+    with _matchersLock:
+        entry = _matchers.get(key)
+        if entry is not None and entry[0] is gestureList and entry[1] == gestures:
+            del _matchers[key]
+            _matchers[key] = entry # it is now the most recently used
+            return entry[3]
+
+        vocabulary = tuple(map(tuple, gestures))
+        for otherEntry in _matchers.values():
+            if otherEntry[2] == vocabulary:
+                matcher = otherEntry[3]
+                break
+        else:
+            matcher = GestureMatcher(vocabulary, cache=matchCache)
+        _matchers.pop(key, None)
+        # The list itself is kept so that its id can't be reused by another
+        # list while it is a key.
+        _matchers[key] = (gestureList, [gesture[:] for gesture in gestures], vocabulary, matcher)
+        if len(_matchers) > _MATCHERS_SIZE:
+            _matchers.popitem(last=False)
+        return matcher
+
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions maxsize currsize')
+
+class LRUCache(object):
+    """
+    A thread-safe, least recently used cache of match results. Once it holds
+    `maxsize` results, adding a new one evicts the result that was used least
+    recently. The `hits`, `misses`, and `evictions` counters can be used to
+    pick a good `maxsize`.
+    """
+    def __init__(self, maxsize=_MATCH_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def __len__(self):
+        return len(self._results)
+
+
+    def get(self, key, default=None):
+        """
+        Returns the result for `key`, or `default` if it isn't in the cache.
+        """
+        with self._lock:
+            try:
+                result = self._results.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._results[key] = result # move it to the most recently used end
+            self.hits += 1
+            return result
+
+
+    def put(self, key, result):
+        """
+        Adds the result for `key` to the cache, evicting the least recently
+        used results if the cache is full.
+        """
+        with self._lock:
+            self._results.pop(key, None)
+            self._results[key] = result
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+
+    def resize(self, maxsize):
+        """
+        Changes the maximum number of results, evicting results if needed.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self):
+        """
+        Removes every result from the cache. The counters aren't reset.
+        """
+        with self._lock:
+            self._results.clear()
+
+
+    def info(self):
+        """
+        Returns a CacheInfo namedtuple of the cache's counters and size.
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._results))
+
+
+# The cache that findClosestMatchingGesture() uses.
+matchCache = LRUCache(_MATCH_CACHE_SIZE)
+
+# The number of gesture lists that findClosestMatchingGesture() keeps a
+# GestureMatcher for.
+_MATCHERS_SIZE = 8
+
+# Maps the id of each of the last _MATCHERS_SIZE gesture lists passed to
+# findClosestMatchingGesture() to a (gestureList, copy of its gestures, tuple
+# of its gestures as tuples, GestureMatcher) tuple, least recently used first.
+_matchers = OrderedDict()
+_matchersLock = threading.Lock()
+
+
+class _HashedTuple(tuple):
     """
-    if len(gestureList) == 0:
-        return None
+    A tuple that calculates its hash only once, so that a large vocabulary
+    can be part of every results cache key without hashing all of it again.
+    """
+    def __new__(cls, items):
+        self = tuple.__new__(cls, items)
+        self._hash = tuple.__hash__(self)
+        return self
 
-    #gestureList = [list(frozenset(tuple(gesture))) for gesture in gestureList] # make a unique list
-    gestureList = frozenset([tuple(gesture) for gesture in gestureList])
-    distances = {}
-    for g in gestureList:
-        levDist = levenshteinDistance(strokes, g)
-        if maxDifference is None or levDist <= maxDifference:
-            distances.setdefault(levDist, [])
-            distances[levDist].append(g)
 
-    if not distances:
-        return None # No matching gestures are within the tolerance of maxDifference.
+    def __hash__(self):
+        return self._hash
 
-    return tuple(distances[min(distances.keys())])
 
+class GestureMatcher(object):
+    """
+    Finds the closest matching gestures in a vocabulary of gestures that is
+    prepared once, instead of every time `findClosestMatchingGesture()` is
+    called. Duplicate gestures are removed, and gestures that exactly match the
+    strokes are found with a hash lookup without calculating any Levenshtein
+    distances.
 
-def levenshteinDistance(s1, s2):
+    If `cache` is an LRUCache, the results of `match()` are kept in it.
+
+    If NumPy is installed and there are at least _NUMPY_MIN_GESTURES gestures,
+    the vocabulary is padded into 2D arrays of gestures of similar lengths,
+    and the Levenshtein distances to every gesture in each array are
+    calculated at once.
+    """
+    _numpyMinGestures = _NUMPY_MIN_GESTURES
+
+    def __init__(self, gestureList, cache=None):
+        self._cache = cache
+        self._gestures = _uniqueGestures(gestureList)
+        # The results cache is keyed on the gestures rather than on this
+        # matcher, since several matchers for the same gestures can share it.
+        self._cacheKey = _HashedTuple(self._gestures)
+        self._codes = tuple([_encodeGesture(gesture) for gesture in self._gestures])
+        self._codeIndexes = {} # maps each encoded gesture to the list of its indexes in the vocabulary
+        for i in range(len(self._codes)):
+            self._codeIndexes.setdefault(self._codes[i], []).append(i)
+        if _moosegesture_numpy is not None and self._numpyMinGestures is not None and len(self._codes) >= self._numpyMinGestures:
+            self._vocabularyArray = _moosegesture_numpy.vocabularyBuckets(self._codes)
+        else:
+            self._vocabularyArray = None
+
+
+    def __len__(self):
+        return len(self._gestures)
+
+
+    @property
+    def gestures(self):
+        """The tuple of unique gestures (as tuples) in the vocabulary."""
+        return self._gestures
+
+
+    def match(self, strokes, maxDifference=None):
+        """
+        Returns a tuple of the gesture(s) that closest match `strokes`, the
+        same as `findClosestMatchingGesture()`. Returns None if the vocabulary
+        is empty or no gesture is within `maxDifference`.
+        """
+        stats = _stats # read once, in case another thread disables the stats
+        if stats is None:
+            return self._match(strokes, maxDifference, None)
+        return self._recorded(stats, 'match', self._match, strokes, maxDifference)
+
+
+    def _recorded(self, stats, operation, method, *args):
+        """
+        Returns `method(*args, counts)`, and records its time and the
+        Levenshtein distances and cells it calculated in `stats` as a call of
+        `operation`.
+        """
+        startTime = _timer()
+        counts = [0, 0]
+        result = method(*(args + (counts,)))
+        stats._record(operation, {'matching': _timer() - startTime},
+                       {'levenshteinDistances': counts[0], 'levenshteinCells': counts[1]})
+        return result
+
+
+    def _match(self, strokes, maxDifference, counts):
+        """
+        Returns the result of `match()`. If `counts` is a [distances, cells]
+        list, the Levenshtein distances and cells calculated are added to it.
+        """
+        if not self._gestures:
+            return None
+        if maxDifference is not None and maxDifference < 0:
+            return None
+        strokeCodes = _encodeGesture(strokes)
+        exactIndexes = self._codeIndexes.get(strokeCodes)
+        if exactIndexes is not None:
+            # Exact matches (such as a gesture of directions and the same
+            # gesture of direction codes) are always the only closest gestures.
+            return tuple([self._gestures[i] for i in exactIndexes])
+        if maxDifference is not None and maxDifference < 1:
+            return None # only an exact match could have been close enough
+
+        if self._cache is not None:
+            key = (self._cacheKey, strokeCodes, maxDifference)
+            result = self._cache.get(key, _NOT_CACHED)
+            if result is not _NOT_CACHED:
+                return result
+
+        closestDistance, closest = self._closest(strokeCodes, maxDifference, counts)
+        if not closest:
+            result = None # No matching gestures are within the tolerance of maxDifference.
+        else:
+            result = tuple([self._gestures[i] for i in closest])
+        if self._cache is not None:
+            self._cache.put(key, result)
+        return result
+
+
+    def findWithin(self, strokes, maxDifference):
+        """
+        Returns a list of (distance, gesture) tuples for every gesture within
+        `maxDifference` of `strokes`, sorted by distance. Gestures with the
+        same distance are in the order they are in the vocabulary.
+        """
+        stats = _stats
+        if stats is None:
+            return self._findWithin(strokes, maxDifference, None)
+        return self._recorded(stats, 'findWithin', self._findWithin, strokes, maxDifference)
+
+
+    def _findWithin(self, strokes, maxDifference, counts):
+        found = self._within(_encodeGesture(strokes), maxDifference, counts)
+        found.sort()
+        return [(levDist, self._gestures[i]) for levDist, i in found]
+
+
+    def kClosest(self, strokes, k, maxDifference=None):
+        """
+        Returns a list of up to `k` (distance, gesture) tuples for the
+        gestures closest to `strokes`, the same as `findKClosestGestures()`.
+        """
+        stats = _stats
+        if stats is None:
+            return self._rankedClosest(strokes, k, maxDifference, None)
+        return self._recorded(stats, 'kClosest', self._rankedClosest, strokes, k, maxDifference)
+
+
+    def _rankedClosest(self, strokes, k, maxDifference, counts):
+        if k < 1 or not self._gestures:
+            return []
+        ranked = [(-negDistance, -negIndex) for negDistance, negIndex in self._kClosest(_encodeGesture(strokes), k, maxDifference, counts)]
+        ranked.sort()
+        return [(levDist, self._gestures[i]) for levDist, i in ranked]
+
+
+    def _kClosest(self, strokeCodes, k, maxDifference, counts):
+        """
+        Returns a heap of (-distance, -index) tuples for the `k` gestures
+        closest to the encoded `strokeCodes`, so that the farthest of them is
+        at the top of the heap. The `counts` are the same as for `_match()`.
+        """
+        if self._vocabularyArray is not None:
+            distances = self._allDistances(strokeCodes, maxDifference, counts)
+            ranked = numpy.argsort(distances, kind='stable')
+            if maxDifference is not None:
+                ranked = ranked[distances[ranked] <= maxDifference]
+            ranked = ranked[:k].tolist()
+            return [(-int(distances[i]), -i) for i in ranked]
+
+        heap = []
+        for i in range(len(self._codes)):
+            # Once there are k gestures, only gestures closer than the
+            # farthest of them are needed, so nothing farther is calculated.
+            limit = maxDifference
+            if len(heap) == k:
+                if limit is None or -heap[0][0] - 1 < limit:
+                    limit = -heap[0][0] - 1
+                if limit < 0:
+                    break # the k gestures are all exact matches
+            if limit is None:
+                levDist = _levenshteinCodes(strokeCodes, self._codes[i], counts)
+            else:
+                levDist = _boundedLevenshteinCodes(strokeCodes, self._codes[i], limit, counts)
+                if levDist > limit:
+                    continue
+            if len(heap) < k:
+                heapq.heappush(heap, (-levDist, -i))
+            else:
+                heapq.heapreplace(heap, (-levDist, -i))
+        return heap
+
+
+    def _closest(self, strokeCodes, maxDifference, counts):
+        """
+        Returns a (closestDistance, closest) tuple, where `closest` is the
+        sorted list of vocabulary indexes of the gestures closest to the
+        encoded `strokeCodes`. The `counts` are the same as for `_match()`.
+        """
+        if self._vocabularyArray is not None:
+            distances = self._allDistances(strokeCodes, maxDifference, counts)
+            closestDistance = int(distances.min())
+            if maxDifference is not None and closestDistance > maxDifference:
+                return None, []
+            return closestDistance, numpy.flatnonzero(distances == closestDistance).tolist()
+
+        closestDistance = None
+        closest = []
+        for i in range(len(self._codes)):
+            # Distances over maxDifference or the closest distance so far are
+            # thrown away, so they don't need to be calculated exactly.
+            if closestDistance is not None and (maxDifference is None or closestDistance < maxDifference):
+                levDist = _boundedLevenshteinCodes(strokeCodes, self._codes[i], closestDistance, counts)
+            elif maxDifference is not None:
+                levDist = _boundedLevenshteinCodes(strokeCodes, self._codes[i], maxDifference, counts)
+            else:
+                levDist = _levenshteinCodes(strokeCodes, self._codes[i], counts)
+            if maxDifference is not None and levDist > maxDifference:
+                continue
+            if closestDistance is None or levDist < closestDistance:
+                closestDistance = levDist
+                closest = [i]
+            elif levDist == closestDistance:
+                closest.append(i)
+        return closestDistance, closest
+
+
+    def _within(self, strokeCodes, maxDifference, counts):
+        """
+        Returns an unsorted list of (distance, index) tuples for the gestures
+        within `maxDifference` of the encoded `strokeCodes`. The `counts` are
+        the same as for `_match()`.
+        """
+        if self._vocabularyArray is not None:
+            distances = self._allDistances(strokeCodes, maxDifference, counts)
+            within = numpy.flatnonzero(distances <= maxDifference)
+            return list(zip(distances[within].tolist(), within.tolist()))
+
+        found = []
+        for i in range(len(self._codes)):
+            levDist = _boundedLevenshteinCodes(strokeCodes, self._codes[i], maxDifference, counts)
+            if levDist <= maxDifference:
+                found.append((levDist, i))
+        return found
+
+
+    def _allDistances(self, strokeCodes, maxDistance, counts):
+        """
+        Returns a NumPy array of the Levenshtein distances from the encoded
+        `strokeCodes` to every gesture in the vocabulary. If `maxDistance` is
+        given, distances larger than it are maxDistance + 1.
+        """
+        return _moosegesture_numpy.levenshteinBuckets(strokeCodes, self._vocabularyArray, len(self._codes), maxDistance, counts)
+
+
+_NOT_CACHED = object() # a sentinel, since None is a valid match result
+
+
+class BKTreeMatcher(GestureMatcher):
+    """
+    A GestureMatcher that indexes its vocabulary in a BK-tree, so that large
+    vocabularies can be searched without calculating the Levenshtein distance
+    to every gesture.
+
+    Each node in the tree is a gesture, and its children are keyed by their
+    distance from it. Because the Levenshtein distance obeys the triangle
+    inequality, when the query is distance d from a node, only the children
+    keyed from d - limit to d + limit can have gestures within `limit` of the
+    query. Searches with a small `maxDifference` visit the smallest fraction
+    of the vocabulary.
+
+    Each visited distance is calculated in pure Python, so if NumPy is
+    installed, a GestureMatcher (which calculates all the distances at once)
+    is usually faster.
+    """
+    _numpyMinGestures = None # the tree is searched instead of the whole vocabulary
+
+    def __init__(self, gestureList, cache=None):
+        GestureMatcher.__init__(self, gestureList, cache)
+
+        # Each node is a [vocabulary index, {distance: child node}] list.
+        self._root = None
+        for i in range(len(self._codes)):
+            if self._root is None:
+                self._root = [i, {}]
+                continue
+            node = self._root
+            while True:
+                levDist = _levenshteinCodes(self._codes[i], self._codes[node[0]])
+                child = node[1].get(levDist)
+                if child is None:
+                    node[1][levDist] = [i, {}]
+                    break
+                node = child
+
+
+    def _closest(self, strokeCodes, maxDifference, counts):
+        closestDistance = None
+        closest = []
+        limit = maxDifference
+        # Each stack item is a (node, parent's distance, node's key) tuple, so
+        # that nodes can be skipped if `limit` shrank after they were pushed.
+        stack = [(self._root, 0, 0)]
+        while stack:
+            node, parentDistance, key = stack.pop()
+            if limit is not None and abs(key - parentDistance) > limit:
+                continue
+            levDist = _levenshteinCodes(strokeCodes, self._codes[node[0]], counts)
+            if limit is None or levDist <= limit:
+                if closestDistance is None or levDist < closestDistance:
+                    closestDistance = levDist
+                    closest = [node[0]]
+                elif levDist == closestDistance:
+                    closest.append(node[0])
+                limit = closestDistance
+            # Push the children farthest from levDist first, so the most
+            # promising children are popped first and shrink `limit` sooner.
+            children = sorted(node[1].items(), key=lambda item: -abs(item[0] - levDist))
+            for childKey, child in children:
+                if limit is None or abs(childKey - levDist) <= limit:
+                    stack.append((child, levDist, childKey))
+        closest.sort()
+        return closestDistance, closest
+
+
+    def _kClosest(self, strokeCodes, k, maxDifference, counts):
+        heap = []
+        limit = maxDifference
+        stack = [(self._root, 0, 0)]
+        while stack:
+            node, parentDistance, key = stack.pop()
+            if limit is not None and abs(key - parentDistance) > limit:
+                continue
+            levDist = _levenshteinCodes(strokeCodes, self._codes[node[0]], counts)
+            if limit is None or levDist <= limit:
+                # Nodes aren't visited in vocabulary order, so a gesture as
+                # far as the farthest of the k gestures can still replace it.
+                candidate = (-levDist, -node[0])
+                if len(heap) < k:
+                    heapq.heappush(heap, candidate)
+                elif candidate > heap[0]:
+                    heapq.heapreplace(heap, candidate)
+                if len(heap) == k and (limit is None or -heap[0][0] < limit):
+                    limit = -heap[0][0]
+            children = sorted(node[1].items(), key=lambda item: -abs(item[0] - levDist))
+            for childKey, child in children:
+                if limit is None or abs(childKey - levDist) <= limit:
+                    stack.append((child, levDist, childKey))
+        return heap
+
+
+    def _within(self, strokeCodes, maxDifference, counts):
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            levDist = _levenshteinCodes(strokeCodes, self._codes[node[0]], counts)
+            if levDist <= maxDifference:
+                found.append((levDist, node[0]))
+            for childKey, child in node[1].items():
+                if abs(childKey - levDist) <= maxDifference:
+                    stack.append(child)
+        return found
+
+
+class GestureTrie(object):
+    """
+    A prefix tree of a vocabulary of gestures, for checking which gestures can
+    still be made from the strokes recognized so far while the mouse is still
+    being dragged. Each lookup takes time proportional to the number of
+    strokes, no matter how large the vocabulary is.
+
+    For example, an app can reject the gesture as soon as `isDeadPrefix()`
+    returns True, or act on `uniqueCompletion()` before the mouse button is
+    released.
+    """
+    def __init__(self, gestureList):
+        self._gestures = _uniqueGestures(gestureList)
+
+        # Each node is a [{direction code: child node}, reachable gestures]
+        # list, so that strokes can be looked up as strings or codes.
+        self._root = [{}, []]
+        for gesture in self._gestures:
+            node = self._root
+            node[1].append(gesture)
+            for code in bytearray(_encodeGesture(gesture)):
+                node = node[0].setdefault(code, [{}, []])
+                node[1].append(gesture)
+
+        # Turn the reachable lists into tuples, so they can be returned as is.
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            node[1] = tuple(node[1])
+            stack.extend(node[0].values())
+
+
+    def __len__(self):
+        return len(self._gestures)
+
+
+    def _node(self, strokes):
+        try:
+            codes = bytearray(_encodeGesture(strokes))
+        except KeyError:
+            return None # no gesture has a stroke that isn't a direction
+        node = self._root
+        for code in codes:
+            node = node[0].get(code)
+            if node is None:
+                return None
+        return node
+
+
+    def reachable(self, strokes):
+        """
+        Returns a tuple of the gestures (as tuples) that start with `strokes`,
+        in the order they are in the vocabulary. This is an empty tuple if
+        `strokes` is a dead prefix.
+        """
+        node = self._node(strokes)
+        if node is None:
+            return ()
+        return node[1]
+
+
+    def isDeadPrefix(self, strokes):
+        """
+        Returns True if no gesture in the vocabulary starts with `strokes`.
+        """
+        return self._node(strokes) is None
+
+
+    def uniqueCompletion(self, strokes):
+        """
+        Returns the gesture (as a tuple) if it is the only gesture that starts
+        with `strokes`, otherwise returns None.
+        """
+        node = self._node(strokes)
+        if node is None or len(node[1]) != 1:
+            return None
+        return node[1][0]
+
+
+def _uniqueGestures(gestureList):
+    """
+    Returns a tuple of the gestures in `gestureList` as tuples, with the
+    duplicates removed.
+    """
+    gestures = []
+    seen = set()
+    for gesture in gestureList:
+        gesture = tuple(gesture)
+        if gesture not in seen:
+            seen.add(gesture)
+            gestures.append(gesture)
+    return tuple(gestures)
+
+
+SyntheticTrace = namedtuple('SyntheticTrace', 'points gesture')
+
+# The unit vector of each direction, for drawing synthetic traces.
+_DIRECTION_VECTORS = {UP: (0.0, -1.0), DOWN: (0.0, 1.0), LEFT: (-1.0, 0.0), RIGHT: (1.0, 0.0),
+                      UPLEFT: (-sqrt(0.5), -sqrt(0.5)), UPRIGHT: (sqrt(0.5), -sqrt(0.5)),
+                      DOWNLEFT: (-sqrt(0.5), sqrt(0.5)), DOWNRIGHT: (sqrt(0.5), sqrt(0.5))}
+
+def syntheticTrace(gesture, seed=None, sampleRate=125, speed=800, jitter=0.0, overshoot=0.0,
+                   strokeLength=(1.5, 3.0), minStrokeLen=None, start=(0, 0), integer=True):
+    """
+    Returns a SyntheticTrace namedtuple of the `points` of a mouse trace that
+    draws `gesture` (a list of directions), and the `gesture` itself as a
+    list, which is the ground truth the trace was drawn from. This is meant
+    for load testing and for measuring how well gestures are recognized.
+
+    The trace is drawn at `speed` pixels per second and sampled `sampleRate`
+    times per second, starting at the `start` point. Each stroke's length is
+    picked at random from the (low, high) range of `strokeLength` (or is
+    exactly `strokeLength` if it is a number), in multiples of `minStrokeLen`
+    (by default, _MIN_STROKE_LEN).
+
+    Each sampled point is moved by Gaussian noise with a standard deviation
+    of `jitter` pixels. At each corner, the mouse goes past it by up to
+    `overshoot` times minStrokeLen before coming back for the next stroke.
+    An `overshoot` under 1 keeps the overshoot from being long enough to be
+    recognized as a stroke of its own, although heavy jitter and overshoot
+    can still make a trace that isn't recognized as its ground truth.
+
+    If `integer` is True, the points are rounded to integers like real mouse
+    positions. As with real high-rate mice, a high `sampleRate` (or low
+    `speed`) then gives moves of a pixel or less, many of them repeated or
+    not in the stroke's direction, which the `minPointDistance` setting of
+    GestureRecognizer is meant for. The `seed` is passed to random.Random(), or can be a
+    random.Random object to draw from.
+    """
+    rng = seed if isinstance(seed, random.Random) else random.Random(seed)
+    if minStrokeLen is None:
+        minStrokeLen = _MIN_STROKE_LEN
+    gesture = list(gesture)
+    for i in range(len(gesture)):
+        if gesture[i] not in _DIRECTION_VECTORS:
+            raise ValueError('%r is not a direction' % (gesture[i],))
+        if i > 0 and gesture[i] == gesture[i - 1]:
+            raise ValueError('gesture has %r twice in a row, which is never recognized as two strokes' % (gesture[i],))
+    if not speed > 0:
+        raise ValueError('speed must be positive, not %r' % (speed,))
+    if not sampleRate > 0:
+        raise ValueError('sampleRate must be positive, not %r' % (sampleRate,))
+    if isinstance(strokeLength, (tuple, list)):
+        shortest, longest = strokeLength
+    else:
+        shortest = longest = strokeLength
+
+    # The corners of the path, including the overshoots past them.
+    x, y = float(start[0]), float(start[1])
+    corners = [(x, y)]
+    for i in range(len(gesture)):
+        dx, dy = _DIRECTION_VECTORS[gesture[i]]
+        length = rng.uniform(shortest, longest) * minStrokeLen
+        x += dx * length
+        y += dy * length
+        if overshoot and i < len(gesture) - 1:
+            past = rng.uniform(0, overshoot) * minStrokeLen
+            corners.append((x + dx * past, y + dy * past))
+        corners.append((x, y))
+
+    # Sample the path at evenly spaced times, carrying the leftover distance
+    # from one leg of the path to the next.
+    step = float(speed) / sampleRate
+    points = []
+    position = 0.0
+    for (x1, y1), (x2, y2) in zip(corners, corners[1:]):
+        legLength = sqrt((x2 - x1) * (x2 - x1) + (y2 - y1) * (y2 - y1))
+        while position < legLength:
+            fraction = position / legLength
+            points.append(_syntheticPoint(rng, x1 + (x2 - x1) * fraction, y1 + (y2 - y1) * fraction, jitter, integer))
+            position += step
+        position -= legLength
+    points.append(_syntheticPoint(rng, corners[-1][0], corners[-1][1], jitter, integer))
+    return SyntheticTrace(points, gesture)
+
+
+def _syntheticPoint(rng, x, y, jitter, integer):
+    """
+    Returns the (x, y) point of a synthetic trace, moved by `jitter` and
+    rounded if `integer` is True.
+    """
+    if jitter:
+        x += rng.gauss(0, jitter)
+        y += rng.gauss(0, jitter)
+    if integer:
+        return (int(round(x)), int(round(y)))
+    return (x, y)
+
+
+def syntheticTraces(gestures, count=None, seed=None, **options):
+    """
+    Yields `count` SyntheticTrace namedtuples (or yields them forever if
+    `count` is None) for gestures picked at random from `gestures`. The
+    `options` are the keyword arguments of `syntheticTrace()`.
+
+    The traces are generated lazily, one at a time, so millions of them can
+    be streamed without keeping them in memory. The same `seed` always yields
+    the same traces.
+    """
+    gestures = [list(gesture) for gesture in gestures]
+    rng = random.Random(seed)
+    numTraces = 0
+    while count is None or numTraces < count:
+        yield syntheticTrace(rng.choice(gestures), rng, **options)
+        numTraces += 1
+
+
+def levenshteinDistance(s1, s2, maxDistance=None):
     """
     Returns the Levenshtein Distance between two strings, `s1` and `s2` as an
     integer.
@@ -134,110 +1746,601 @@ def levenshteinDistance(s1, s2):
     3, since the following three edits change one into the other, and there
     is no way to do it with fewer than three edits:
       kitten -> sitten -> sittin -> sitting
+
+    If `maxDistance` is given, only distances up to `maxDistance` are
+    calculated exactly, and maxDistance + 1 is returned for any distance
+    larger than that. This is much faster when most strings are far apart.
+    """
+    if maxDistance is not None and maxDistance < 0:
+        raise ValueError('maxDistance must not be negative, not %r' % (maxDistance,))
+    codes1 = _encodeGesture(s1)
+    codes2 = _encodeGesture(s2)
+    if maxDistance is not None:
+        return _boundedLevenshteinCodes(codes1, codes2, maxDistance)
+    return _levenshteinCodes(codes1, codes2)
+
+
+def gestureDistanceMatrix(gestures, workers=1, maxDistance=None, filename=None, tileSize=256):
+    """
+    Returns the Levenshtein distances between every pair of gestures in
+    `gestures`, as a condensed matrix: the distance between gestures i and j
+    (where i < j) is at index n*i - i*(i+1)//2 + (j-i-1), the same layout as
+    scipy's pdist(). The matrix is an array.array of the smallest unsigned
+    integer type that can hold the distances.
+
+    Duplicate gestures only have their distances calculated once. The pairs
+    of unique gestures are split into tiles of `tileSize` by `tileSize`
+    gestures, which are calculated in a pool of `workers` processes (by
+    default, just this process). If `maxDistance` is given, distances larger
+    than it are stored as maxDistance + 1 and the banded kernels stop
+    calculating them as soon as they are known to be too large.
+
+    If `filename` is given, the matrix is written to a memory-mapped file
+    instead and returned as a numpy.memmap, which requires NumPy. The tiles
+    are written straight into the file (or, if there are duplicate gestures,
+    into a temporary file for the unique gestures), so the matrix never has
+    to fit in memory.
+    """
+    if maxDistance is not None and maxDistance < 0:
+        raise ValueError('maxDistance must not be negative, not %r' % (maxDistance,))
+    gestureCodes = [_encodeGesture(gesture) for gesture in gestures]
+    numGestures = len(gestureCodes)
+
+    # Calculate the condensed matrix of the unique gestures.
+    uniqueIndexes = {}
+    inverse = array.array('l', [uniqueIndexes.setdefault(codes, len(uniqueIndexes)) for codes in gestureCodes])
+    uniqueCodes = [None] * len(uniqueIndexes)
+    for codes, i in uniqueIndexes.items():
+        uniqueCodes[i] = codes
+    numUnique = len(uniqueCodes)
+
+    largest = max([len(codes) for codes in uniqueCodes] + [0])
+    if maxDistance is not None:
+        largest = min(largest, maxDistance + 1)
+    typecode = _smallestTypecode(largest)
+
+    size = numGestures * (numGestures - 1) // 2
+    uniqueSize = numUnique * (numUnique - 1) // 2
+    if filename is not None:
+        if numpy is None:
+            raise ImportError('gestureDistanceMatrix() requires NumPy to write a memory-mapped file.')
+        dtype = numpy.dtype('u%d' % array.array(typecode).itemsize)
+        matrix = numpy.memmap(filename, dtype=dtype, mode='w+', shape=(size,))
+        if numUnique == numGestures:
+            uniqueMatrix = matrix # the tiles are written straight into the file
+        else:
+            # The unique gestures' matrix goes in a temporary file, so that
+            # neither matrix has to fit in memory.
+            import tempfile
+            uniqueMatrix = numpy.memmap(tempfile.TemporaryFile(), dtype=dtype, mode='w+', shape=(uniqueSize,))
+    else:
+        uniqueMatrix = array.array(typecode, [0]) * uniqueSize
+    tiles = []
+    for rowStart in range(0, numUnique, tileSize):
+        for colStart in range(rowStart, numUnique, tileSize):
+            tiles.append((rowStart, min(rowStart + tileSize, numUnique), colStart, min(colStart + tileSize, numUnique)))
+    if workers is not None and workers > 1 and len(tiles) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers, _initDistanceWorker, (uniqueCodes, maxDistance, typecode))
+        try:
+            for tile, rowValues in pool.imap_unordered(_distanceTileWorker, tiles):
+                _storeTile(uniqueMatrix, numUnique, tile, rowValues)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for tile in tiles:
+            _storeTile(uniqueMatrix, numUnique, tile, _distanceTile(uniqueCodes, maxDistance, typecode, tile))
+
+    # Expand it to the condensed matrix of all the gestures.
+    if numUnique == numGestures:
+        if filename is not None:
+            uniqueMatrix.flush()
+        return uniqueMatrix
+    if filename is None:
+        matrix = array.array(typecode, [0]) * size
+    if numpy is not None:
+        _expandDistancesNumpy(uniqueMatrix, numUnique, inverse, matrix)
+    else:
+        k = 0
+        for i in range(numGestures):
+            a = inverse[i]
+            for j in range(i + 1, numGestures):
+                b = inverse[j]
+                if a != b:
+                    low, high = min(a, b), max(a, b)
+                    matrix[k] = uniqueMatrix[numUnique*low - low*(low+1)//2 + (high-low-1)]
+                k += 1
+    if filename is not None:
+        matrix.flush()
+    return matrix
+
+
+def _smallestTypecode(largest):
+    """
+    Returns the array.array typecode of the smallest unsigned integer type
+    that can hold `largest`.
     """
-    singleLetterMapping = {DOWNLEFT: '1', DOWN:'2', DOWNRIGHT:'3',
-                           LEFT:'4', RIGHT:'6',
-                           UPLEFT:'7', UP:'8', UPRIGHT:'9'}
+    for typecode in ('B', 'H', 'I', 'L'):
+        if largest < 2 ** (8 * array.array(typecode).itemsize):
+            return typecode
+    raise ValueError('%r is too large for an array.array' % (largest,))
 
-    len1 = len([singleLetterMapping[letter] for letter in s1])
-    len2 = len([singleLetterMapping[letter] for letter in s2])
 
-    matrix = list(range(len1 + 1)) * (len2 + 1)
-    for i in range(len2 + 1):
-        matrix[i] = list(range(i, i + len1 + 1))
-    for i in range(len2):
+def _distanceTile(codesList, maxDistance, typecode, tile):
+    """
+    Returns a list of arrays of the distances in `tile`, one for each row. A
+    tile is a (rowStart, rowEnd, colStart, colEnd) tuple of indexes into
+    `codesList`, and only the distances above the diagonal are included.
+    """
+    rowStart, rowEnd, colStart, colEnd = tile
+    rowValues = []
+    if _moosegesture_numpy is not None:
+        matrix, lengths = _moosegesture_numpy.vocabularyArray(codesList[colStart:colEnd])
+        for row in range(rowStart, rowEnd):
+            first = max(colStart, row + 1) - colStart
+            distances = _moosegesture_numpy.levenshteinOneToMany(codesList[row], matrix[first:], lengths[first:], maxDistance)
+            rowValues.append(array.array(typecode, distances.astype(numpy.dtype('u%d' % array.array(typecode).itemsize)).tobytes()))
+        return rowValues
+
+    for row in range(rowStart, rowEnd):
+        codes = codesList[row]
+        values = array.array(typecode)
+        for col in range(max(colStart, row + 1), colEnd):
+            if maxDistance is None:
+                values.append(_levenshteinCodes(codes, codesList[col]))
+            else:
+                values.append(_boundedLevenshteinCodes(codes, codesList[col], maxDistance))
+        rowValues.append(values)
+    return rowValues
+
+
+def _storeTile(matrix, n, tile, rowValues):
+    """
+    Copies the rows of distances for `tile` into the condensed `matrix` of
+    `n` gestures.
+    """
+    rowStart, rowEnd, colStart, colEnd = tile
+    for row, values in zip(range(rowStart, rowEnd), rowValues):
+        start = n*row - row*(row+1)//2 + (max(colStart, row + 1) - row - 1)
+        matrix[start:start + len(values)] = values
+
+
+_distanceWorkerArgs = None
+
+def _initDistanceWorker(codesList, maxDistance, typecode):
+    """
+    Sets up a worker process of `gestureDistanceMatrix()` with the unique
+    gestures, so that each task only has to send the tile's indexes.
+    """
+    global _distanceWorkerArgs
+    _distanceWorkerArgs = (codesList, maxDistance, typecode)
+
+
+def _distanceTileWorker(tile):
+    codesList, maxDistance, typecode = _distanceWorkerArgs
+    return tile, _distanceTile(codesList, maxDistance, typecode, tile)
+
+
+def _expandDistancesNumpy(uniqueMatrix, numUnique, inverse, matrix):
+    """
+    Fills in the condensed `matrix` of all the gestures from the condensed
+    `uniqueMatrix` of the unique gestures, one row at a time.
+    """
+    if isinstance(uniqueMatrix, array.array):
+        unique = numpy.frombuffer(uniqueMatrix, dtype=numpy.dtype('u%d' % uniqueMatrix.itemsize))
+    else:
+        unique = uniqueMatrix
+    output = numpy.frombuffer(matrix, dtype=unique.dtype) if isinstance(matrix, array.array) else matrix
+    inverse = numpy.frombuffer(inverse, dtype=numpy.dtype('i%d' % inverse.itemsize))
+    numGestures = len(inverse)
+    k = 0
+    for i in range(numGestures - 1):
+        a = inverse[i]
+        b = inverse[i + 1:]
+        low = numpy.minimum(a, b)
+        high = numpy.maximum(a, b)
+        indexes = numUnique*low - low*(low+1)//2 + (high-low-1)
+        row = output[k:k + len(b)]
+        numpy.take(unique, numpy.where(a == b, 0, indexes), out=row)
+        row[a == b] = 0
+        k += len(b)
+
+
+def _encodeGesture(gesture):
+    """
+    Returns the gesture (a sequence of direction strings or integer direction
+    codes) as a bytes object of direction codes, so that comparing two
+    directions is an integer compare.
+    """
+    return bytes(bytearray([_ENCODED_DIRECTIONS[direction] for direction in gesture]))
+
+
+def _levenshteinCodes(codes1, codes2, counts=None):
+    """
+    Returns the Levenshtein Distance between the encoded gestures `codes1` and
+    `codes2`. Only two rows of the matrix are kept, and they are reused for
+    every row, so nothing is allocated for each cell.
+
+    If `counts` is a [distances, cells] list, one distance and the number of
+    cells calculated are added to it.
+    """
+    len1 = len(codes1)
+    if counts is not None:
+        counts[0] += 1
+        counts[1] += len1 * len(codes2)
+    previous = list(range(len1 + 1))
+    current = [0] * (len1 + 1)
+    for i in range(len(codes2)):
+        code = codes2[i]
+        diagonal = i
+        left = current[0] = i + 1
         for j in range(len1):
-            if s1[j] == s2[i]:
-                matrix[i+1][j+1] = min(matrix[i+1][j] + 1, matrix[i][j+1] + 1, matrix[i][j])
+            up = previous[j + 1]
+            if codes1[j] == code:
+                left = diagonal # a match is never more than an insertion or deletion
             else:
-                matrix[i+1][j+1] = min(matrix[i+1][j] + 1, matrix[i][j+1] + 1, matrix[i][j] + 1)
-    return matrix[len2][len1]
+                if up < diagonal:
+                    diagonal = up
+                if left < diagonal:
+                    diagonal = left
+                left = diagonal + 1
+            current[j + 1] = left
+            diagonal = up
+        previous, current = current, previous
+    return previous[len1]
 
 
-def _identifyStrokes(points):
-    strokes = []
-    strokeSegments = []
+def _boundedLevenshteinCodes(codes1, codes2, maxDistance, counts=None):
+    """
+    Returns the Levenshtein Distance between the encoded gestures `codes1` and
+    `codes2`, or maxDistance + 1 if it is larger than `maxDistance`.
+
+    Only the diagonal band of the matrix within `maxDistance` of the main
+    diagonal is calculated, since any path through a cell outside of it
+    already has more than `maxDistance` insertions or deletions. The
+    calculation stops early once every cell in a row is over `maxDistance`.
+
+    If `counts` is a [distances, cells] list, one distance and the number of
+    cells calculated are added to it.
+    """
+    len1 = len(codes1)
+    len2 = len(codes2)
+    tooFar = maxDistance + 1
+    if counts is not None:
+        counts[0] += 1
+    if abs(len1 - len2) > maxDistance:
+        return tooFar
+    numCells = 0
+
+    previous = [min(j, tooFar) for j in range(len1 + 1)]
+    current = [tooFar] * (len1 + 1)
+    for i in range(1, len2 + 1):
+        code = codes2[i - 1]
+        first = max(1, i - maxDistance)
+        last = min(len1, i + maxDistance)
+        numCells += last - first + 1
+        left = current[first - 1] = min(i, tooFar) if first == 1 else tooFar
+        rowMin = left
+        for j in range(first, last + 1):
+            if codes1[j - 1] == code:
+                cell = previous[j - 1]
+            else:
+                cell = previous[j - 1]
+                if previous[j] < cell:
+                    cell = previous[j]
+                if left < cell:
+                    cell = left
+                cell += 1
+                if cell > tooFar:
+                    cell = tooFar
+            current[j] = left = cell
+            if cell < rowMin:
+                rowMin = cell
+        if rowMin > maxDistance:
+            if counts is not None:
+                counts[1] += numCells
+            return tooFar # every path to the last cell goes through this row
+        if last < len1:
+            current[last + 1] = tooFar # the next row's band reaches one cell further
+        previous, current = current, previous
+    if counts is not None:
+        counts[1] += numCells
+    return previous[len1]
+
+
+def _identifyStrokes(points, minStrokeLen=None, numpyMinPoints=_NUMPY_MIN_POINTS):
+    """
+    Returns a (strokes, strokeSegments) tuple of the direction codes and the
+    [start, end] point pair indexes of each stroke in `points`. If
+    `minStrokeLen` is None, _MIN_STROKE_LEN is used. The NumPy backend is used
+    for traces with at least `numpyMinPoints` points (whether they are
+    sequences or buffers), and for all traces that are already NumPy arrays,
+    if NumPy is installed.
+    """
+    if minStrokeLen is None:
+        minStrokeLen = _MIN_STROKE_LEN
+    useNumpy = _moosegesture_numpy is not None and numpyMinPoints is not None
+    if useNumpy and isinstance(points, (list, tuple)):
+        useNumpy = len(points) >= numpyMinPoints
+    elif useNumpy and not isinstance(points, numpy.ndarray):
+        # Getting the coordinates of a buffer doesn't copy it, so the number
+        # of points can be checked first.
+        xs, ys = _pointCoordinates(points)
+        if len(xs) < numpyMinPoints:
+            return _identifyStrokesCoordinates(xs, ys, minStrokeLen)
+    if useNumpy:
+        return _identifyStrokesArray(_moosegesture_numpy.pointArray(points), minStrokeLen)
+    xs, ys = _pointCoordinates(points)
+    return _identifyStrokesCoordinates(xs, ys, minStrokeLen)
+
+
+def _identifyStrokesArray(points, minStrokeLen):
+    """
+    Returns the (strokes, strokeSegments) tuple for the (N, 2) float64 array
+    `points` using the NumPy backend. If stats are being recorded, each stage
+    is timed separately and recorded in _stats.
+    """
+    stats = _stats
+    if stats is None:
+        return _identifyStrokesNumpy(points, minStrokeLen)
+    distanceStart = _timer()
+    distances = _moosegesture_numpy.pairDistances(points)
+    directionStart = _timer()
+    codes = _moosegesture_numpy.pairDirections(points)
+    segmentationStart = _timer()
+    strokes, strokeSegments = _identifyStrokesNumpy(points, minStrokeLen, distances, codes)
+    numWindows = max(len(points) - 1, 0) # every window is found at once
+    _recordIdentifyStrokes(stats, len(points), distanceStart, directionStart, segmentationStart, numWindows)
+    return strokes, strokeSegments
+
+
+def _identifyStrokesCoordinates(xs, ys, minStrokeLen):
+    """
+    Returns the (strokes, strokeSegments) tuple for the points with the x and
+    y coordinates in the sequences `xs` and `ys` using the pure Python
+    implementation. If stats are being recorded, each stage is timed
+    separately and recorded in _stats.
+    """
+    stats = _stats
+    if stats is None:
+        return _identifyStrokesPython(xs, ys, minStrokeLen)
+    distanceStart = _timer()
+    distances, prefixDistances = _pairDistances(xs, ys)
+    directionStart = _timer()
+    directions, runStarts = _pairDirections(xs, ys)
+    segmentationStart = _timer()
+    strokes, strokeSegments, numWindows = _segmentStrokes(distances, prefixDistances, directions, runStarts, minStrokeLen)
+    _recordIdentifyStrokes(stats, len(xs), distanceStart, directionStart, segmentationStart, numWindows)
+    return strokes, strokeSegments
+
+
+def _recordIdentifyStrokes(stats, numPoints, distanceStart, directionStart, segmentationStart, numWindows):
+    """
+    Records an 'identifyStrokes' call in `stats` that started each stage at
+    the given times and has just finished.
+    """
+    endTime = _timer()
+    stats._record('identifyStrokes',
+                  {'distance': directionStart - distanceStart,
+                   'direction': segmentationStart - directionStart,
+                   'segmentation': endTime - segmentationStart},
+                  {'points': numPoints, 'directions': max(numPoints - 1, 0), 'windows': numWindows})
+
+
+# The memoryview formats that can be indexed (and so used as coordinates) directly.
+_VIEW_FORMATS = frozenset('bBhHiIlLqQnNfd')
+
 
-    # calculate lengths between each sequential points
+def _pointCoordinates(points):
+    """
+    Returns an (xs, ys) tuple of sequences of the x and y coordinates in
+    `points`. The points can be a sequence of (x, y) tuples, or any object
+    that supports the buffer protocol (such as an array.array, memoryview, or
+    NumPy array) of interleaved x and y values, either flat or in N rows of 2.
+    C-contiguous buffers aren't copied: the coordinates are strided
+    memoryviews of them. Other buffers (such as Fortran-ordered or sliced NumPy
+    arrays, or half floats) are copied, with NumPy if it is installed.
+    """
+    if not isinstance(points, (list, tuple)):
+        try:
+            view = memoryview(points)
+        except TypeError:
+            pass # not a buffer, so it should be a sequence of (x, y) tuples
+        else:
+            if view.nbytes == 0:
+                return (), ()
+            if _moosegesture_numpy is not None and (not view.c_contiguous or view.format.lstrip('@') not in _VIEW_FORMATS):
+                view = memoryview(_moosegesture_numpy.pointArray(points)).cast('B').cast('d')
+            elif not view.c_contiguous:
+                # memoryviews can only be cast if they are C-contiguous, so
+                # copy the values out of this one.
+                values = view.tolist()
+                for i in range(view.ndim - 1):
+                    values = list(itertools.chain.from_iterable(values))
+                if len(values) % 2:
+                    raise ValueError('points buffer has an odd number of values, so it isn\'t interleaved x and y values')
+                return values[0::2], values[1::2]
+            elif view.ndim != 1:
+                view = view.cast('B').cast(view.format)
+            if len(view) % 2:
+                raise ValueError('points buffer has an odd number of values, so it isn\'t interleaved x and y values')
+            return view[0::2], view[1::2]
+    return [point[0] for point in points], [point[1] for point in points]
+
+
+def _identifyStrokesPython(xs, ys, minStrokeLen):
+    """
+    The pure Python implementation of `_identifyStrokes()`.
+
+    Every possible segment start gets a window of point pairs that is just long
+    enough to reach `minStrokeLen`, and the window's stroke is recognized if
+    all its point pairs go in the same direction. Since the window's end never
+    moves backwards as its start moves forward, this takes linear time: each
+    point pair's distance and direction is calculated once, and a window's
+    direction is checked in constant time using runs of the same direction.
+    """
+    distances, prefixDistances = _pairDistances(xs, ys)
+    directions, runStarts = _pairDirections(xs, ys)
+    return _segmentStrokes(distances, prefixDistances, directions, runStarts, minStrokeLen)[:2]
+
+
+def _pairDistances(xs, ys):
+    """
+    Returns a (distances, prefixDistances) tuple of lists of the length of
+    each point pair, and the sums of the lengths before each point pair
+    (with the sum of all of them at the end).
+    """
     distances = []
-    for i in range(len(points)-1):
-        distances.append( _distance(points[i], points[i+1]) )
-
-    # keeps getting points until we go past the min. segment length
-    #startSegPoint = 0
-    #while startSegPoint < len(points)-1:
-    for startSegPoint in range(len(points)-1):
-        segmentDist = 0
-        curDir = None
-        consistent = True
-        direction = None
-        for curSegPoint in range(startSegPoint, len(points)-1):
-            segmentDist += distances[curSegPoint]
-            if segmentDist >= _MIN_STROKE_LEN:
-                # check if all points are going the same direction.
-                for i in range(startSegPoint, curSegPoint):
-                    direction = _getDirection(points[i], points[i+1])
-                    if curDir is None:
-                        curDir = direction
-                    elif direction != curDir:
-                        consistent = False
-                        break
+    prefixDistances = [0.0]
+    total = 0.0
+    for i in range(len(xs) - 1):
+        xdist = xs[i+1] - xs[i]
+        ydist = ys[i+1] - ys[i]
+        dist = sqrt(xdist*xdist + ydist*ydist)
+        distances.append(dist)
+        total += dist
+        prefixDistances.append(total)
+    return distances, prefixDistances
+
+
+def _pairDirections(xs, ys):
+    """
+    Returns a (directions, runStarts) tuple of lists of the direction code
+    of each point pair, and the index of the first point pair in the run of
+    the same direction that each point pair is in.
+    """
+    directions = []
+    runStarts = []
+    direction = runStart = None
+    for i in range(len(xs) - 1):
+        xdist = xs[i+1] - xs[i]
+        ydist = ys[i+1] - ys[i]
+        previous = direction
+        if type(xdist) is not int or type(ydist) is not int:
+            direction = _floatDirectionCode(xdist, ydist)
+        elif -_TABLE_RADIUS <= xdist <= _TABLE_RADIUS and -_TABLE_RADIUS <= ydist <= _TABLE_RADIUS:
+            direction = _DIRECTION_TABLE[(ydist + _TABLE_RADIUS) * _TABLE_WIDTH + (xdist + _TABLE_RADIUS)]
+        else:
+            direction = _integerDirectionCode(xdist, ydist)
+        directions.append(direction)
+        if direction != previous:
+            runStart = i
+        runStarts.append(runStart)
+    return directions, runStarts
+
+
+def _segmentStrokes(distances, prefixDistances, directions, runStarts, minStrokeLen):
+    """
+    Returns a (strokes, strokeSegments, numWindows) tuple of the strokes
+    found from the point pairs' distances and directions, and the number of
+    windows that were checked.
+    """
+    strokes = []
+    strokeSegments = []
+    numPairs = len(distances)
+    numWindows = numPairs
+    exact = _exactDistances(distances, prefixDistances[-1])
+    curSegPoint = 0
+    for startSegPoint in range(numPairs):
+        curSegPoint = max(curSegPoint, startSegPoint)
+        sequentialDist = None
+        while curSegPoint < numPairs:
+            reached, sequentialDist = _windowReachesMinLen(distances, prefixDistances, startSegPoint, curSegPoint,
+                                                           minStrokeLen, exact, sequentialDist)
+            if reached:
                 break
-        if not consistent:
-            continue
-        elif (direction is not None and ( (not len(strokes)) or (len(strokes) and strokes[-1] != direction) )):
-            strokes.append(direction)
-            strokeSegments.append( [startSegPoint, curSegPoint] )
-        elif len(strokeSegments):
-            # update and lengthen the latest stroke since this stroke is being lengthened.
-            strokeSegments[-1][1] = curSegPoint
+            curSegPoint += 1
+        if curSegPoint == numPairs:
+            # This window (and every window after it) never reaches
+            # minStrokeLen, so they just lengthen the latest stroke.
+            if strokeSegments:
+                strokeSegments[-1][1] = numPairs - 1
+            numWindows = startSegPoint + 1
+            break
+        _updateStrokes(strokes, strokeSegments, startSegPoint, curSegPoint,
+                       *_windowDirection(directions, runStarts, startSegPoint, curSegPoint - 1))
+    return strokes, strokeSegments, numWindows
+
+
+def _identifyStrokesNumpy(points, minStrokeLen, distances=None, codes=None):
+    """
+    The NumPy implementation of `_identifyStrokes()`. The distances, directions,
+    and windows are all calculated with vectorized operations, and only the
+    consistent windows are looped over to build the strokes. The point pairs'
+    `distances` and direction `codes` arrays are calculated if they aren't
+    given.
+    """
+    strokes = []
+    strokeSegments = []
+
+    points = _moosegesture_numpy.pointArray(points)
+    numPairs = len(points) - 1
+    if numPairs < 1:
+        return strokes, strokeSegments
+
+    ends, directions = _moosegesture_numpy.strokeWindows(points, minStrokeLen, distances, codes)
+    numReached = int(numpy.searchsorted(ends, numPairs)) # window ends only increase, so the unreached windows are at the end
+    endsList = ends.tolist()
+    directionsList = directions.tolist()
+    for startSegPoint in numpy.flatnonzero(directions[:numReached] >= 0).tolist():
+        _updateStrokes(strokes, strokeSegments, startSegPoint, endsList[startSegPoint],
+                       True, directionsList[startSegPoint])
+    if numReached < numPairs and strokeSegments:
+        strokeSegments[-1][1] = numPairs - 1
     return strokes, strokeSegments
 
+
 def _getDirection(coord1, coord2):
     """
     Return the direction the line formed by the (x, y)
     points in `coord1` and `coord2`.
     """
-    x1, y1 = coord1
-    x2, y2 = coord2
+    return _directionFromDelta(coord2[0] - coord1[0], coord2[1] - coord1[1])
 
-    if x1 == x2 and y1 == y2:
+
+def _directionFromDelta(xdist, ydist):
+    """
+    Return the direction of a line that goes `xdist` to the right and `ydist`
+    down.
+    """
+    if xdist == 0 and ydist == 0:
         return None # two coordinates are the same.
-    elif x1 == x2 and y1 > y2:
+    elif xdist == 0 and ydist < 0:
         return UP
-    elif x1 == x2 and y1 < y2:
+    elif xdist == 0 and ydist > 0:
         return DOWN
-    elif x1 > x2 and y1 == y2:
+    elif xdist < 0 and ydist == 0:
         return LEFT
-    elif x1 < x2 and y1 == y2:
+    elif xdist > 0 and ydist == 0:
         return RIGHT
 
-    slope = float(y2 - y1) / float(x2 - x1)
+    slope = float(ydist) / float(xdist)
 
     # Figure out which quadrant the line is going in, and then
     # determine the closest direction by calculating the slope
-    if x2 > x1 and y2 < y1: # up right quadrant
+    if xdist > 0 and ydist < 0: # up right quadrant
         if slope > -0.4142:
             return RIGHT # slope is between 0 and 22.5 degrees
         elif slope < -2.4142:
             return UP # slope is between 67.5 and 90 degrees
         else:
             return UPRIGHT # slope is between 22.5 and 67.5 degrees
-    elif x2 > x1 and y2 > y1: # down right quadrant
+    elif xdist > 0 and ydist > 0: # down right quadrant
         if slope > 2.4142:
             return DOWN
         elif slope < 0.4142:
             return RIGHT
         else:
             return DOWNRIGHT
-    elif x2 < x1 and y2 < y1: # up left quadrant
+    elif xdist < 0 and ydist < 0: # up left quadrant
         if slope < 0.4142:
             return LEFT
         elif slope > 2.4142:
             return UP
         else:
             return UPLEFT
-    elif x2 < x1 and y2 > y1: # down left quadrant
+    elif xdist < 0 and ydist > 0: # down left quadrant
         if slope < -2.4142:
             return DOWN
         elif slope > -0.4142:
@@ -245,6 +2348,69 @@ def _getDirection(coord1, coord2):
         else:
             return DOWNLEFT
 
+# The slope thresholds that _directionFromDelta() compares against (tan(22.5)
+# and tan(67.5) degrees), as exact fractions over _SLOPE_DENOMINATOR.
+_SLOPE_DENOMINATOR = 10000
+_TAN_22_5 = 4142
+_TAN_67_5 = 24142
+
+# _integerDirectionCode() is only exactly the same as _directionFromDelta()
+# while the float division there can't round a slope onto the other side of a
+# threshold, which is guaranteed for deltas smaller than this.
+_MAX_INTEGER_DELTA = 2 ** 31
+
+# _DIRECTION_TABLE[(ydist + _TABLE_RADIUS) * _TABLE_WIDTH + (xdist + _TABLE_RADIUS)]
+# is the direction code of small integer deltas, which are the most common
+# ones from high-rate mice.
+_TABLE_RADIUS = 16
+_TABLE_WIDTH = 2 * _TABLE_RADIUS + 1
+
+def _directionCode(xdist, ydist):
+    """
+    Returns the direction code of a line that goes `xdist` to the right and
+    `ydist` down, or _NO_DIRECTION if both are 0.
+    """
+    if type(xdist) is int and type(ydist) is int:
+        return _integerDirectionCode(xdist, ydist)
+    return _floatDirectionCode(xdist, ydist)
+
+
+def _floatDirectionCode(xdist, ydist):
+    """
+    Returns the direction code for `_directionFromDelta()`'s direction.
+    """
+    return _DIRECTION_CODES.get(_directionFromDelta(xdist, ydist), _NO_DIRECTION)
+
+
+def _integerDirectionCode(xdist, ydist):
+    """
+    Returns the code of the same direction as `_directionFromDelta()` for
+    integer `xdist` and `ydist`, without any division or floats. Small deltas
+    are looked up in _DIRECTION_TABLE, and the rest are classified by
+    comparing the cross-multiplied slope against the thresholds.
+    """
+    if -_TABLE_RADIUS <= xdist <= _TABLE_RADIUS and -_TABLE_RADIUS <= ydist <= _TABLE_RADIUS:
+        return _DIRECTION_TABLE[(ydist + _TABLE_RADIUS) * _TABLE_WIDTH + (xdist + _TABLE_RADIUS)]
+    across = abs(xdist)
+    down = abs(ydist)
+    if across >= _MAX_INTEGER_DELTA or down >= _MAX_INTEGER_DELTA:
+        return _floatDirectionCode(xdist, ydist)
+
+    if down * _SLOPE_DENOMINATOR < across * _TAN_22_5: # includes ydist == 0
+        return 6 if xdist > 0 else 4 # RIGHT or LEFT
+    elif down * _SLOPE_DENOMINATOR > across * _TAN_67_5: # includes xdist == 0
+        return 2 if ydist > 0 else 8 # DOWN or UP
+    elif xdist > 0:
+        return 3 if ydist > 0 else 9 # DOWNRIGHT or UPRIGHT
+    else:
+        return 1 if ydist > 0 else 7 # DOWNLEFT or UPLEFT
+
+
+_DIRECTION_TABLE = tuple([_floatDirectionCode(xdist, ydist)
+                          for ydist in range(-_TABLE_RADIUS, _TABLE_RADIUS + 1)
+                          for xdist in range(-_TABLE_RADIUS, _TABLE_RADIUS + 1)])
+
+
 def _distance(coord1, coord2):
     """
     Return the distance between two points, `coord1` and `coord2`. These
@@ -253,3 +2419,7 @@ def _distance(coord1, coord2):
     xdist = coord1[0] - coord2[0]
     ydist = coord1[1] - coord2[1]
     return sqrt(xdist*xdist + ydist*ydist)
+
+
+if sys.version_info >= (3, 6):
+    from ._moosegesture_async import astrokes
@@ -0,0 +1,47 @@
+"""
+asyncio support for MooseGesture.
+
+This module is only imported by moosegesture on Python 3.6 and later, since it
+uses async generators. Its functions are available from the moosegesture
+module itself.
+"""
+
+from . import _DIRECTION_CODES, _defaultRecognizer
+
+
+async def astrokes(points, recognizer=None, codes=False):
+    """
+    Yields a (direction, [start, end]) tuple for each stroke drawn by the
+    points from the async iterator `points` of (x, y) tuples, such as pointer
+    events arriving from a websocket, as soon as the stroke is finished. The
+    tuples are the same as what `getGestureAndSegments()` would return for
+    all the points.
+
+    A stroke is finished once the next stroke has started, since until then
+    more points could lengthen it. The last stroke is yielded when `points`
+    runs out. The finished strokes come from the onStrokeEnd callback of a
+    StrokeRecognizer, which only does a constant amount of work (amortized)
+    for each point, so the event loop is never blocked by rescanning them.
+
+    The `recognizer` is the GestureRecognizer whose settings are used (by
+    default, the same settings as `getGesture()`). If `codes` is True, the
+    directions are yielded as integer codes.
+    """
+    if recognizer is None:
+        recognizer = _defaultRecognizer()
+    finished = []
+    strokeRecognizer = recognizer.strokeRecognizer(onStrokeEnd=lambda direction, segment: finished.append((direction, segment)))
+    async for x, y in points:
+        strokeRecognizer.addPoint(x, y)
+        while finished:
+            yield _strokeTuple(finished.pop(0), codes)
+    strokeRecognizer.finish()
+    while finished:
+        yield _strokeTuple(finished.pop(0), codes)
+
+
+def _strokeTuple(stroke, codes):
+    direction, segment = stroke
+    if codes:
+        direction = _DIRECTION_CODES[direction]
+    return direction, segment
@@ -0,0 +1,273 @@
+"""
+NumPy backend for MooseGesture's stroke identification.
+
+This module is only imported by moosegesture if NumPy is installed. It
+calculates the distance and direction of every point pair in a trace in one
+vectorized pass, and then finds the window for every segment start at once.
+
+Directions are returned as integer codes laid out like a numeric keypad (the
+same as `_CODE_DIRECTIONS` in moosegesture/__init__.py), with 0 meaning the
+point pair has no direction:
+
+    7 8 9      UL U UR
+    4   6  ->  L     R
+    1 2 3      DL D DR
+"""
+
+import sys
+
+import numpy
+
+NO_DIRECTION = 0
+
+_FLOAT_EPSILON = sys.float_info.epsilon
+
+# Whole numbers below this are exactly representable as floats.
+_MAX_EXACT_FLOAT = 2 ** 53
+
+
+def pointArray(points):
+    """
+    Returns `points` as a C-contiguous (N, 2) float64 array.
+    """
+    points = numpy.ascontiguousarray(points, dtype=numpy.float64)
+    return points.reshape(-1, 2)
+
+
+def pairDirections(points):
+    """
+    Returns an integer array of the direction code of each point pair in the
+    (N, 2) array `points`. The same slope comparisons are used as in
+    moosegesture's `_getDirection()`, so the results are identical.
+    """
+    dx = points[1:, 0] - points[:-1, 0]
+    dy = points[1:, 1] - points[:-1, 1]
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        slope = dy / dx
+
+    codes = numpy.zeros(len(dx), dtype=numpy.int8)
+    # straight lines
+    codes[(dx == 0) & (dy < 0)] = 8
+    codes[(dx == 0) & (dy > 0)] = 2
+    codes[(dx < 0) & (dy == 0)] = 4
+    codes[(dx > 0) & (dy == 0)] = 6
+
+    # up right quadrant
+    quadrant = (dx > 0) & (dy < 0)
+    codes[quadrant] = numpy.where(slope[quadrant] > -0.4142, 6, numpy.where(slope[quadrant] < -2.4142, 8, 9))
+    # down right quadrant
+    quadrant = (dx > 0) & (dy > 0)
+    codes[quadrant] = numpy.where(slope[quadrant] > 2.4142, 2, numpy.where(slope[quadrant] < 0.4142, 6, 3))
+    # up left quadrant
+    quadrant = (dx < 0) & (dy < 0)
+    codes[quadrant] = numpy.where(slope[quadrant] < 0.4142, 4, numpy.where(slope[quadrant] > 2.4142, 8, 7))
+    # down left quadrant
+    quadrant = (dx < 0) & (dy > 0)
+    codes[quadrant] = numpy.where(slope[quadrant] < -2.4142, 2, numpy.where(slope[quadrant] > -0.4142, 4, 1))
+    return codes
+
+
+def pairDistances(points):
+    """
+    Returns a float64 array of the length of each point pair in the (N, 2)
+    array `points`. (This is sqrt(dx*dx + dy*dy) rather than numpy.hypot() so
+    that the lengths are bit-for-bit the same as moosegesture's `_distance()`.)
+    """
+    dx = points[:-1, 0] - points[1:, 0]
+    dy = points[:-1, 1] - points[1:, 1]
+    return numpy.sqrt(dx * dx + dy * dy)
+
+
+def strokeWindows(points, minStrokeLen, distances=None, codes=None):
+    """
+    Returns a (ends, directions) tuple of arrays for the (N, 2) array
+    `points`, which must have at least two points. For each segment start,
+    `ends` has the index of the point pair where the window first reaches
+    `minStrokeLen` (or N - 1 if it never does), and `directions` has the
+    window's direction code, or -1 if the point pairs in the window aren't all
+    going the same direction. The `distances` and `codes` from
+    `pairDistances()` and `pairDirections()` are calculated if not given.
+    """
+    if distances is None:
+        distances = pairDistances(points)
+    if codes is None:
+        codes = pairDirections(points)
+    numPairs = len(distances)
+    starts = numpy.arange(numPairs)
+
+    prefixDistances = numpy.zeros(numPairs + 1)
+    numpy.cumsum(distances, out=prefixDistances[1:])
+
+    ends = numpy.searchsorted(prefixDistances, prefixDistances[:-1] + minStrokeLen, side='left') - 1
+    ends = numpy.maximum(ends, starts)
+
+    # The prefix sums can round differently than adding up each window, so
+    # windows that are close to minStrokeLen are added up one at a time. If
+    # all the distances are whole numbers with an exact sum (such as for
+    # axis-aligned moves of integer traces) the prefix sums have no rounding
+    # error, so this isn't needed.
+    if not (prefixDistances[-1] < _MAX_EXACT_FLOAT and numpy.array_equal(distances, numpy.floor(distances))):
+        tolerance = 4 * (numPairs + 1) * _FLOAT_EPSILON * prefixDistances[-1]
+        clippedEnds = numpy.minimum(ends, numPairs - 1)
+        ambiguous = numpy.abs(prefixDistances[clippedEnds + 1] - prefixDistances[:-1] - minStrokeLen) <= tolerance
+        ambiguous |= numpy.abs(prefixDistances[clippedEnds] - prefixDistances[:-1] - minStrokeLen) <= tolerance
+        for start in numpy.flatnonzero(ambiguous).tolist():
+            ends[start] = _sequentialEnd(distances, start, int(clippedEnds[start]) + 2, minStrokeLen)
+
+    # A window is consistent if its last run of the same direction reaches
+    # back to the start, or if only point pairs with no direction come before
+    # that run.
+    changes = numpy.ones(numPairs, dtype=bool)
+    changes[1:] = codes[1:] != codes[:-1]
+    runStarts = numpy.maximum.accumulate(numpy.where(changes, starts, 0))
+
+    last = numpy.clip(ends - 1, 0, numPairs - 1)
+    lastCodes = codes[last]
+    lastRunStarts = runStarts[last]
+    beforeRun = numpy.maximum(lastRunStarts - 1, 0)
+    consistent = (lastRunStarts <= starts) | ((lastCodes != NO_DIRECTION) &
+                                              (codes[beforeRun] == NO_DIRECTION) &
+                                              (runStarts[beforeRun] <= starts))
+    directions = numpy.where(consistent, lastCodes, -1)
+    directions[ends == starts] = NO_DIRECTION # single point pair windows don't check any directions
+    return ends, directions
+
+
+def _sequentialEnd(distances, start, stop, minStrokeLen):
+    """
+    Returns the index of the point pair where the distances from `start`,
+    added up one at a time, first reach `minStrokeLen` (or the number of
+    point pairs if they never do). The distances up to `stop` are added up
+    with one cumsum (which adds them in order), and only the rest of them (if
+    the window doesn't reach minStrokeLen by then) are added up in a loop.
+    """
+    numPairs = len(distances)
+    stop = min(stop, numPairs)
+    sums = numpy.cumsum(distances[start:stop])
+    reached = numpy.flatnonzero(sums >= minStrokeLen)
+    if len(reached):
+        return start + int(reached[0])
+    segmentDist = float(sums[-1])
+    for end in range(stop, numPairs):
+        segmentDist += float(distances[end])
+        if segmentDist >= minStrokeLen:
+            return end
+    return numPairs
+
+
+def vocabularyArray(codesList):
+    """
+    Returns a (matrix, lengths) tuple for the list of encoded gestures (bytes
+    of direction codes) in `codesList`. Each row of the uint8 `matrix` is a
+    gesture padded with NO_DIRECTION codes to the length of the longest one,
+    and `lengths` has each gesture's actual length.
+    """
+    lengths = numpy.array([len(codes) for codes in codesList], dtype=numpy.intp)
+    matrix = numpy.zeros((len(codesList), int(lengths.max()) if len(codesList) else 0), dtype=numpy.uint8)
+    for i, codes in enumerate(codesList):
+        matrix[i, :len(codes)] = numpy.frombuffer(codes, dtype=numpy.uint8)
+    return matrix, lengths
+
+
+def vocabularyBuckets(codesList):
+    """
+    Returns a list of (indexes, matrix, lengths) tuples that split the encoded
+    gestures in `codesList` into buckets of gestures of similar lengths (from
+    2**k to 2**(k+1) - 1 strokes). Each bucket is padded by
+    `vocabularyArray()` only to the length of its own longest gesture, so one
+    very long gesture doesn't make every gesture's row as long as it is.
+    `indexes` is an array of the bucket's gestures' indexes in `codesList`.
+    """
+    buckets = {}
+    for i, codes in enumerate(codesList):
+        buckets.setdefault(len(codes).bit_length(), []).append(i)
+    result = []
+    for key in sorted(buckets):
+        indexes = buckets[key]
+        matrix, lengths = vocabularyArray([codesList[i] for i in indexes])
+        result.append((numpy.array(indexes, dtype=numpy.intp), matrix, lengths))
+    return result
+
+
+def levenshteinBuckets(queryCodes, buckets, numGestures, maxDistance=None, counts=None):
+    """
+    Returns an integer array of the Levenshtein distances between the encoded
+    gesture `queryCodes` and all `numGestures` gestures in the `buckets` from
+    `vocabularyBuckets()`, calculated one bucket at a time by
+    `levenshteinOneToMany()` (which `maxDistance` and `counts` are passed to).
+    """
+    distances = numpy.empty(numGestures, dtype=numpy.int32)
+    for indexes, matrix, lengths in buckets:
+        distances[indexes] = levenshteinOneToMany(queryCodes, matrix, lengths, maxDistance, counts)
+    return distances
+
+
+def levenshteinOneToMany(queryCodes, matrix, lengths, maxDistance=None, counts=None):
+    """
+    Returns an integer array of the Levenshtein distances between the encoded
+    gesture `queryCodes` and every gesture in the padded `matrix` from
+    `vocabularyArray()`.
+
+    The matrix rows for all the gestures are calculated at the same time, one
+    query stroke at a time. The insertion costs along each row depend on the
+    cell to their left, but they can be vectorized as a running minimum:
+    row[j] = min(row[k] + (j - k) for k <= j).
+
+    If `maxDistance` is given, distances larger than it are returned as
+    maxDistance + 1 without being calculated exactly: gestures whose length
+    differs from the query's by more than maxDistance are skipped, and
+    gestures are dropped once every cell in their current row is over
+    maxDistance (since the distance can't be smaller than that row's
+    minimum).
+
+    If `counts` is a [distances, cells] list, the number of gestures whose
+    distance was calculated and the number of cells calculated (including
+    the padding) are added to it.
+    """
+    numGestures, maxLen = matrix.shape
+    columns = numpy.arange(maxLen + 1, dtype=numpy.int32)
+    if maxDistance is not None:
+        result = numpy.full(numGestures, maxDistance + 1, dtype=numpy.int32)
+        rows = numpy.flatnonzero(numpy.abs(lengths - len(queryCodes)) <= maxDistance)
+        if len(rows) < numGestures:
+            matrix = matrix[rows]
+            lengths = lengths[rows]
+    previous = numpy.tile(columns, (len(matrix), 1))
+    current = numpy.empty_like(previous)
+    if counts is not None:
+        counts[0] += len(matrix)
+    for i, code in enumerate(bytearray(queryCodes)):
+        if counts is not None:
+            counts[1] += matrix.size
+        current[:, 0] = i + 1
+        # substitutions (or matches) and deletions
+        numpy.add(previous[:, :-1], matrix != code, out=current[:, 1:])
+        numpy.minimum(current[:, 1:], previous[:, 1:] + 1, out=current[:, 1:])
+        # insertions
+        current -= columns
+        numpy.minimum.accumulate(current, axis=1, out=current)
+        current += columns
+        previous, current = current, previous
+        if maxDistance is not None and i >= maxDistance:
+            # (A row's minimum is at most its first cell, i + 1, so no
+            # gesture can be dropped before this.) Counting the padding cells in the minimum can only keep a
+            # gesture longer than needed, never drop it too soon. Gestures
+            # are only dropped once half of them can be, since copying the
+            # arrays costs more than calculating a few extra rows, and the
+            # extra rows' distances are over maxDistance anyway.
+            keep = previous.min(axis=1) <= maxDistance
+            numKept = int(numpy.count_nonzero(keep))
+            if numKept <= len(keep) // 2:
+                rows = rows[keep]
+                matrix = matrix[keep]
+                lengths = lengths[keep]
+                previous = previous[keep]
+                current = numpy.empty_like(previous)
+                if not len(rows):
+                    break
+    distances = previous[numpy.arange(len(matrix)), lengths]
+    if maxDistance is None:
+        return distances
+    result[rows] = numpy.minimum(distances, maxDistance + 1)
+    return result
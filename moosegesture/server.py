@@ -0,0 +1,439 @@
+"""
+A local gesture recognition server, so that many worker processes can share
+one recognizer and gesture matcher instead of each importing moosegesture.
+
+Usage:
+    python -m moosegesture.server [serve] (--unix PATH | --port PORT) [--host 127.0.0.1]
+                                  [--gestures FILE] [--max-difference N]
+                                  [--min-stroke-len 60] [--batch-size 256] [--batch-delay 2]
+    python -m moosegesture.server bench (--unix PATH | --port PORT) [--host 127.0.0.1]
+                                  [--connections 8] [--requests 200] [--traces 16] [--seed 42]
+
+Requests and responses are JSON objects, one per line (JSONL). A request has
+a batch of traces, each a flat list of interleaved x and y coordinates (or a
+list of [x, y] pairs):
+
+    {"id": 1, "traces": [[332, 385, 332, 287, 332, 175], ...]}
+
+and its response has the gesture of each trace, in the same order:
+
+    {"id": 1, "gestures": [["U"], ...], "matches": [[["U", "R"]], ...]}
+
+The "matches" are only included if the server was started with --gestures,
+which is a JSON file of a list of gestures. They are the closest matching
+gestures for each trace (the same as findClosestMatchingGesture()), or null
+if none are within --max-difference. An invalid request gets a response with
+an "error" message instead.
+
+Requests from all the connections go on one queue. A batching thread takes
+requests from it until it has --batch-size traces or --batch-delay
+milliseconds have passed since the first one, recognizes all their traces,
+matches each distinct gesture in the batch only once, and then hands each
+connection its results.
+
+The bench command is a load generator: it sends requests of synthetic traces
+over several connections at once, and prints the throughput and the p50 and
+p99 latency of the requests.
+"""
+
+import argparse
+import array
+import json
+import math
+import os
+import socket
+import stat
+import sys
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver # Python 2
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue # Python 2
+
+from . import GestureMatcher, GestureRecognizer, LRUCache, UP, DOWN, LEFT, RIGHT, UPLEFT, UPRIGHT, DOWNLEFT, DOWNRIGHT
+from . import _clock, syntheticTraces
+
+# The traces that the batching thread recognizes at once, at most.
+_BATCH_SIZE = 256
+
+# How long (in seconds) the batching thread waits for more requests after the
+# first request of a batch.
+_BATCH_DELAY = 0.002
+
+# The gestures that the load generator draws traces of.
+_BENCH_GESTURES = [[UP], [DOWN, RIGHT], [LEFT, UP, RIGHT], [UPRIGHT, DOWNRIGHT], [DOWNLEFT, UPLEFT, UP], [RIGHT, DOWN, LEFT, UP]]
+
+
+class GestureServer(object):
+    """
+    Serves gesture recognition requests on `address`, which is a Unix socket
+    path string or a (host, port) tuple. The traces are recognized by the
+    GestureRecognizer `recognizer`, and if `gestureList` is given, the
+    gestures are matched against it with a GestureMatcher.
+
+    Call `serveForever()` to handle requests until `shutdown()` is called.
+    """
+    def __init__(self, address, recognizer=None, gestureList=None, maxDifference=None,
+                 batchSize=_BATCH_SIZE, batchDelay=_BATCH_DELAY):
+        self.recognizer = recognizer if recognizer is not None else GestureRecognizer()
+        if gestureList is not None:
+            self.matcher = GestureMatcher(gestureList, cache=LRUCache())
+        else:
+            self.matcher = None
+        self.maxDifference = maxDifference
+        self.batchSize = batchSize
+        self.batchDelay = batchDelay
+        self._requests = queue.Queue()
+        self._batchThread = None
+
+        self._closed = False
+        if isinstance(address, str):
+            serverClass = _ThreadingUnixServer
+            self._socketPath = address
+            _removeStaleSocket(address)
+        else:
+            serverClass = _ThreadingTCPServer
+            self._socketPath = None
+        self._server = serverClass(address, _RequestHandler)
+        self._server.gestureServer = self
+
+
+    @property
+    def address(self):
+        """The address the server is listening on."""
+        return self._server.server_address
+
+
+    def serveForever(self):
+        """
+        Handles requests until `shutdown()` is called.
+        """
+        self._batchThread = threading.Thread(target=self._batchLoop)
+        self._batchThread.daemon = True
+        self._batchThread.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._requests.put(None) # tells the batching thread to stop
+            self._batchThread.join()
+
+
+    def shutdown(self):
+        """
+        Stops `serveForever()` (from another thread) and closes the socket.
+        """
+        self._server.shutdown()
+        self.close()
+
+
+    def close(self):
+        """
+        Closes the socket, and removes the Unix socket file. This can be
+        called more than once.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._server.server_close()
+        if self._socketPath is not None:
+            try:
+                os.unlink(self._socketPath)
+            except OSError:
+                pass # it was already removed
+
+
+    def _handleLine(self, line):
+        """
+        Returns the response dict for one line of a request.
+        """
+        requestId = None
+        try:
+            request = json.loads(line.decode('utf-8'))
+            requestId = request.get('id')
+            traces = [_traceArray(trace) for trace in request['traces']]
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            return {'id': requestId, 'error': 'invalid request: %s' % (exc,)}
+
+        pending = _PendingRequest(traces)
+        self._requests.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            return {'id': requestId, 'error': pending.error}
+        response = {'id': requestId, 'gestures': pending.gestures}
+        if self.matcher is not None:
+            response['matches'] = pending.matches
+        return response
+
+
+    def _batchLoop(self):
+        """
+        Takes batches of requests off the queue and runs them, until it gets
+        None from the queue.
+        """
+        while True:
+            pending = self._requests.get()
+            if pending is None:
+                return
+            batch = [pending]
+            numTraces = len(pending.traces)
+            deadline = _clock() + self.batchDelay
+            while numTraces < self.batchSize:
+                timeout = deadline - _clock()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if pending is None:
+                    self._requests.put(None) # stop after this batch
+                    break
+                batch.append(pending)
+                numTraces += len(pending.traces)
+            self._runBatch(batch)
+
+
+    def _runBatch(self, batch):
+        """
+        Recognizes and matches the traces of every request in `batch`, and
+        wakes up the connections waiting for them.
+        """
+        matches = {}
+        for pending in batch:
+            try:
+                pending.gestures = [self.recognizer.getGesture(trace) for trace in pending.traces]
+                if self.matcher is not None:
+                    pending.matches = []
+                    for gesture in pending.gestures:
+                        key = tuple(gesture)
+                        if key not in matches:
+                            matches[key] = self.matcher.match(gesture, self.maxDifference)
+                        pending.matches.append(matches[key])
+            except Exception as exc:
+                pending.error = 'recognition failed: %s' % (exc,)
+            pending.done.set()
+
+
+class _PendingRequest(object):
+    """
+    The traces of a request waiting in the queue, and its results once the
+    batching thread sets `done`.
+    """
+    def __init__(self, traces):
+        self.traces = traces
+        self.gestures = None
+        self.matches = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def _removeStaleSocket(path):
+    """
+    Removes the Unix socket file at `path` if it was left behind by a server
+    that is no longer running, so that the path can be bound again. A socket
+    that a running server is still listening on is left alone.
+    """
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+    except OSError:
+        return # there's nothing at the path
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error:
+        os.unlink(path) # nothing is listening on it
+    finally:
+        probe.close()
+
+
+def _traceArray(trace):
+    """
+    Returns the trace (a flat list of interleaved x and y coordinates, or a
+    list of [x, y] pairs) as an array.array of interleaved coordinates.
+    """
+    if trace and isinstance(trace[0], list):
+        coordinates = array.array('d')
+        for x, y in trace:
+            coordinates.append(x)
+            coordinates.append(y)
+        return coordinates
+    if len(trace) % 2:
+        raise ValueError('trace has an odd number of coordinates')
+    return array.array('d', trace)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        gestureServer = self.server.gestureServer
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return # the client closed the connection
+            if not line.strip():
+                continue
+            response = gestureServer._handleLine(line)
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:
+    _ThreadingUnixServer = None # Unix sockets aren't supported on this platform
+
+
+class GestureClient(object):
+    """
+    A connection to a GestureServer at `address` (a Unix socket path string
+    or a (host, port) tuple).
+    """
+    def __init__(self, address):
+        if isinstance(address, str):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(address)
+        else:
+            self._socket = socket.create_connection(address)
+        self._file = self._socket.makefile('rb')
+        self._nextId = 0
+
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+    def request(self, traces):
+        """
+        Sends the list of `traces` (each a flat list of interleaved x and y
+        coordinates, or a list of [x, y] pairs) and returns the response dict.
+        """
+        self._nextId += 1
+        self._socket.sendall((json.dumps({'id': self._nextId, 'traces': traces}) + '\n').encode('utf-8'))
+        return json.loads(self._file.readline().decode('utf-8'))
+
+
+def runLoadTest(address, connections=8, requests=200, tracesPerRequest=16, seed=42):
+    """
+    Sends `requests` requests of `tracesPerRequest` synthetic traces on each
+    of `connections` connections at once, and returns a dict of the number of
+    requests and traces, the total seconds, the traces per second, the p50
+    and p99 request latencies in milliseconds, and the number of errors.
+    """
+    # Generate all the requests before timing anything.
+    traces = syntheticTraces(_BENCH_GESTURES, seed=seed, jitter=0.5)
+    workload = []
+    for i in range(connections):
+        connectionRequests = []
+        for j in range(requests):
+            connectionRequests.append([[coordinate for point in next(traces).points for coordinate in point]
+                                       for k in range(tracesPerRequest)])
+        workload.append(connectionRequests)
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def runConnection(connectionRequests):
+        client = GestureClient(address)
+        try:
+            for batch in connectionRequests:
+                startTime = _clock()
+                response = client.request(batch)
+                latency = _clock() - startTime
+                with lock:
+                    latencies.append(latency)
+                    if 'error' in response:
+                        errors[0] += 1
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=runConnection, args=(connectionRequests,)) for connectionRequests in workload]
+    startTime = _clock()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = _clock() - startTime
+
+    latencies.sort()
+    numTraces = connections * requests * tracesPerRequest
+    return {'requests': len(latencies),
+            'traces': numTraces,
+            'seconds': seconds,
+            'tracesPerSecond': numTraces / seconds if seconds else None,
+            'p50LatencyMs': _percentile(latencies, 0.50) * 1000,
+            'p99LatencyMs': _percentile(latencies, 0.99) * 1000,
+            'errors': errors[0]}
+
+
+def _percentile(sortedValues, fraction):
+    """
+    Returns the value at `fraction` (from 0 to 1) of the sorted list
+    `sortedValues`, using the nearest-rank method.
+    """
+    if not sortedValues:
+        return 0.0
+    return sortedValues[max(int(math.ceil(fraction * len(sortedValues))) - 1, 0)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command')
+    serveParser = subparsers.add_parser('serve', help='run the server')
+    benchParser = subparsers.add_parser('bench', help='measure the throughput and latency of a running server')
+    for subparser in (serveParser, benchParser):
+        where = subparser.add_mutually_exclusive_group(required=True)
+        where.add_argument('--unix', help='Unix socket path')
+        where.add_argument('--port', type=int, help='TCP port')
+        subparser.add_argument('--host', default='127.0.0.1', help='TCP host (default: 127.0.0.1)')
+    serveParser.add_argument('--gestures', help='JSON file of a list of gestures to match against')
+    serveParser.add_argument('--max-difference', type=int, help='the maxDifference for matching')
+    serveParser.add_argument('--min-stroke-len', type=float, help='the minimum stroke length in pixels')
+    serveParser.add_argument('--batch-size', type=int, default=_BATCH_SIZE, help='the most traces to recognize at once')
+    serveParser.add_argument('--batch-delay', type=float, default=_BATCH_DELAY * 1000,
+                             help='milliseconds to wait for more requests after the first one of a batch')
+    benchParser.add_argument('--connections', type=int, default=8)
+    benchParser.add_argument('--requests', type=int, default=200, help='requests per connection')
+    benchParser.add_argument('--traces', type=int, default=16, help='traces per request')
+    benchParser.add_argument('--seed', type=int, default=42)
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv or argv[0] not in ('serve', 'bench', '-h', '--help'):
+        argv = ['serve'] + list(argv) # serve is the default command
+    args = parser.parse_args(argv)
+
+    address = args.unix if args.unix is not None else (args.host, args.port)
+    if args.command == 'bench':
+        print(json.dumps(runLoadTest(address, args.connections, args.requests, args.traces, args.seed), indent=2, sort_keys=True))
+        return
+
+    gestureList = None
+    if args.gestures is not None:
+        with open(args.gestures) as f:
+            gestureList = json.load(f)
+    server = GestureServer(address, GestureRecognizer(args.min_stroke_len), gestureList, args.max_difference,
+                           args.batch_size, args.batch_delay / 1000.0)
+    sys.stderr.write('moosegesture server listening on %s\n' % (server.address,))
+    try:
+        server.serveForever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
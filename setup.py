@@ -24,6 +24,7 @@ setup(
     license='BSD',
     long_description=long_description,
     packages=['moosegesture'],
+    extras_require={'numpy': ['numpy']},
     test_suite='tests',
     keywords="mouse gesture",
     classifiers=[
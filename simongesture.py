@@ -87,6 +87,8 @@ def main():
             mouseDown = False
             mousex, mousey = None, None
             playerMouseMovement = [] # a list of (x, y) tuples of mouse positions the player has moved
+            playerStrokes = [] # the directions of the player's strokes, added as soon as each one is recognized
+            strokeRecognizer = moosegesture.StrokeRecognizer(onStrokeStart=lambda direction, segment: playerStrokes.append(direction))
             mouseJustReleased = False
             newGame = False
 
@@ -122,7 +124,7 @@ def main():
         if mouseJustReleased:
             mouseJustReleased = False
             # see if the gesture matches
-            gestures = moosegesture.getGesture(playerMouseMovement)
+            gestures = playerStrokes
             if gestures != seq[:score+1]:
                 # gesture didn't match
                 drawGameOver()
@@ -137,14 +139,17 @@ def main():
             animateSequence(seq, score+1)
             waitingForInput = True
             playerMouseMovement = []
+            strokeRecognizer.reset()
+            del playerStrokes[:]
         else:
             # let the player enter their response
             if mousex != None and mousey != None and mouseDown:
                 playerMouseMovement.append( (mousex, mousey) )
+                strokeRecognizer.addPoint(mousex, mousey)
 
             if len(playerMouseMovement) > 1:
                 pygame.draw.lines(WINDOWSURF, BLACK, False, playerMouseMovement)
-                gestures = moosegesture.getGesture(playerMouseMovement)
+                gestures = playerStrokes
                 if len(gestures) > 0:
                     drawArrow(int(WINDOWWIDTH / 2) - HALFARROWSIZE, WINDOWHEIGHT - 80, gestures[-1])
                 if gestures != seq[:len(gestures)] or len(gestures) > score + 1:
@@ -1,12 +1,114 @@
 import unittest
+import array
+import pickle
+import random
+import threading
 import sys
 import os
 sys.path.append(os.path.abspath('..'))
 import moosegesture
+import moosegesture.server
 from moosegesture import UP, DOWN, LEFT, RIGHT, UPLEFT, UPRIGHT, DOWNLEFT, DOWNRIGHT
 
 runningOnPython2 = sys.version_info[0] == 2
 
+
+def randomTraces(seed, numTraces=300, maxLen=40):
+    # Random walks with duplicate points, float coordinates, and short and
+    # long steps, for comparing different implementations against each other.
+    rng = random.Random(seed)
+    traces = []
+    for i in range(numTraces):
+        x, y = rng.randint(0, 500), rng.randint(0, 500)
+        trace = []
+        for j in range(rng.randint(0, maxLen)):
+            trace.append((x, y))
+            if rng.random() < 0.2:
+                continue # next point is a duplicate
+            x += rng.randint(-30, 30)
+            y += rng.randint(-30, 30)
+            if rng.random() < 0.3:
+                x += rng.random()
+        traces.append(trace)
+    return traces
+
+
+def randomGestures(seed, numGestures=100, maxLen=6):
+    rng = random.Random(seed)
+    directions = [UP, DOWN, LEFT, RIGHT, UPLEFT, UPRIGHT, DOWNLEFT, DOWNRIGHT]
+    return [[rng.choice(directions) for j in range(rng.randint(0, maxLen))] for i in range(numGestures)]
+
+
+def withDirections(result):
+    # Returns a (strokes, strokeSegments) result of the internal stroke
+    # identification with the direction codes turned into strings.
+    strokes, strokeSegments = result
+    return moosegesture.codesToDirections(strokes), strokeSegments
+
+
+def identifyStrokesBruteForce(points, minStrokeLen):
+    # The original implementation of moosegesture._identifyStrokes(), which
+    # rescans every window from scratch, for testing the faster
+    # implementations against.
+    strokes = []
+    strokeSegments = []
+
+    # calculate lengths between each sequential points
+    distances = []
+    for i in range(len(points)-1):
+        distances.append( moosegesture._distance(points[i], points[i+1]) )
+
+    # keeps getting points until we go past the min. segment length
+    for startSegPoint in range(len(points)-1):
+        segmentDist = 0
+        curDir = None
+        consistent = True
+        direction = None
+        for curSegPoint in range(startSegPoint, len(points)-1):
+            segmentDist += distances[curSegPoint]
+            if segmentDist >= minStrokeLen:
+                # check if all points are going the same direction.
+                for i in range(startSegPoint, curSegPoint):
+                    direction = moosegesture._getDirection(points[i], points[i+1])
+                    if curDir is None:
+                        curDir = direction
+                    elif direction != curDir:
+                        consistent = False
+                        break
+                break
+        if not consistent:
+            continue
+        elif (direction is not None and ( (not len(strokes)) or (len(strokes) and strokes[-1] != direction) )):
+            strokes.append(direction)
+            strokeSegments.append( [startSegPoint, curSegPoint] )
+        elif len(strokeSegments):
+            # update and lengthen the latest stroke since this stroke is being lengthened.
+            strokeSegments[-1][1] = curSegPoint
+    return strokes, strokeSegments
+
+
+class CountingList(list):
+    # A list that counts how many times its items are looked up by index.
+    def __init__(self, items):
+        list.__init__(self, items)
+        self.numLookups = 0
+
+    def __getitem__(self, index):
+        self.numLookups += 1
+        return list.__getitem__(self, index)
+
+
+def closestGesturesBruteForce(strokes, gestureList, maxDifference=None):
+    # The set of closest gestures, calculated the way findClosestMatchingGesture() originally did.
+    distances = {}
+    for g in frozenset([tuple(gesture) for gesture in gestureList]):
+        levDist = moosegesture.levenshteinDistance(strokes, g)
+        if maxDifference is None or levDist <= maxDifference:
+            distances.setdefault(levDist, set()).add(g)
+    if not distances:
+        return None
+    return distances[min(distances.keys())]
+
 class TestGestureRecognition(unittest.TestCase):
     def test_up(self):
         moosegesture._MIN_STROKE_LEN = 60
@@ -142,5 +244,980 @@ class TestLevenshtein(unittest.TestCase):
             gestures = [[DOWN, LEFT, DOWN], [DOWN, RIGHT, UPRIGHT]]
             self.assertEqual(moosegesture.findClosestMatchingGesture(strokes, gestures), ((DOWN, LEFT, DOWN),))
 
+
+class TestLevenshteinKernels(unittest.TestCase):
+    def levenshteinMatrix(self, s1, s2):
+        # The textbook full matrix calculation, for comparing the kernels against.
+        matrix = [list(range(i, i + len(s1) + 1)) for i in range(len(s2) + 1)]
+        for i in range(len(s2)):
+            for j in range(len(s1)):
+                matrix[i+1][j+1] = min(matrix[i+1][j] + 1, matrix[i][j+1] + 1, matrix[i][j] + (s1[j] != s2[i]))
+        return matrix[len(s2)][len(s1)]
+
+    def test_matchesMatrix(self):
+        gestures = randomGestures(4, numGestures=40, maxLen=8)
+        for s1 in gestures:
+            for s2 in gestures:
+                self.assertEqual(moosegesture.levenshteinDistance(s1, s2), self.levenshteinMatrix(s1, s2))
+
+    def test_invalidDirection(self):
+        self.assertRaises(KeyError, moosegesture.levenshteinDistance, [UP, 'X'], [UP])
+
+
+    @unittest.skipIf(moosegesture.numpy is None, 'NumPy is not installed')
+    def test_numpyOneToMany(self):
+        gestures = randomGestures(9, numGestures=80, maxLen=8)
+        codesList = [moosegesture._encodeGesture(gesture) for gesture in gestures]
+        matrix, lengths = moosegesture._moosegesture_numpy.vocabularyArray(codesList)
+        for strokes in gestures[:20] + [[]]:
+            strokeCodes = moosegesture._encodeGesture(strokes)
+            self.assertEqual(moosegesture._moosegesture_numpy.levenshteinOneToMany(strokeCodes, matrix, lengths).tolist(),
+                             [moosegesture._levenshteinCodes(strokeCodes, codes) for codes in codesList])
+            for maxDistance in (0, 1, 3):
+                self.assertEqual(moosegesture._moosegesture_numpy.levenshteinOneToMany(strokeCodes, matrix, lengths, maxDistance).tolist(),
+                                 [min(moosegesture._levenshteinCodes(strokeCodes, codes), maxDistance + 1) for codes in codesList])
+
+    @unittest.skipIf(moosegesture.numpy is None, 'NumPy is not installed')
+    def test_numpyBuckets(self):
+        # One long gesture only pads its own bucket.
+        gestures = randomGestures(21, numGestures=80, maxLen=8) + [[UP, DOWN] * 100]
+        codesList = [moosegesture._encodeGesture(gesture) for gesture in gestures]
+        buckets = moosegesture._moosegesture_numpy.vocabularyBuckets(codesList)
+        self.assertEqual(sorted(index for indexes, matrix, lengths in buckets for index in indexes.tolist()), list(range(len(gestures))))
+        self.assertEqual([matrix.shape[1] for indexes, matrix, lengths in buckets][-2:], [8, 200])
+        for strokes in gestures[:10] + [[]]:
+            strokeCodes = moosegesture._encodeGesture(strokes)
+            for maxDistance in (None, 2):
+                expected = [moosegesture._levenshteinCodes(strokeCodes, codes) for codes in codesList]
+                if maxDistance is not None:
+                    expected = [min(levDist, maxDistance + 1) for levDist in expected]
+                self.assertEqual(moosegesture._moosegesture_numpy.levenshteinBuckets(strokeCodes, buckets, len(codesList), maxDistance).tolist(), expected)
+
+
+class TestBoundedLevenshtein(unittest.TestCase):
+    def test_matchesUnbounded(self):
+        gestures = randomGestures(3, numGestures=40, maxLen=8)
+        for s1 in gestures:
+            for s2 in gestures:
+                levDist = moosegesture.levenshteinDistance(s1, s2)
+                for maxDistance in range(0, 10):
+                    self.assertEqual(moosegesture.levenshteinDistance(s1, s2, maxDistance), min(levDist, maxDistance + 1))
+
+    def test_lengthDifference(self):
+        self.assertEqual(moosegesture.levenshteinDistance([UP] * 5, [UP], maxDistance=2), 3)
+        self.assertEqual(moosegesture.levenshteinDistance([UP], [UP, DOWN], maxDistance=1), 1)
+        self.assertEqual(moosegesture.levenshteinDistance([UP], [UP], maxDistance=0), 0)
+        self.assertRaises(ValueError, moosegesture.levenshteinDistance, [UP], [DOWN, LEFT, RIGHT], maxDistance=-1)
+
+
+class TestGestureMatcher(unittest.TestCase):
+    def test_matchesBruteForce(self):
+        vocabulary = randomGestures(1, numGestures=60)
+        pythonMatcher = moosegesture.GestureMatcher(vocabulary)
+        pythonMatcher._vocabularyArray = None # don't use the NumPy kernel, even if it's installed
+        for matcher in (moosegesture.GestureMatcher(vocabulary), pythonMatcher):
+            for strokes in randomGestures(2, numGestures=100) + vocabulary[:10]:
+                for maxDifference in (None, 0, 1, 2, 4):
+                    result = matcher.match(strokes, maxDifference)
+                    expected = closestGesturesBruteForce(strokes, vocabulary, maxDifference)
+                    self.assertEqual(result if result is None else set(result), expected)
+
+    def test_exactMatchAndDuplicates(self):
+        matcher = moosegesture.GestureMatcher([[UP, RIGHT], [UP, RIGHT], (DOWN,)])
+        self.assertEqual(len(matcher), 2)
+        self.assertEqual(matcher.match([UP, RIGHT]), ((UP, RIGHT),))
+        self.assertEqual(matcher.match([UP, LEFT], maxDifference=0), None)
+        self.assertEqual(moosegesture.GestureMatcher([]).match([UP]), None)
+
+    def test_findWithin(self):
+        matcher = moosegesture.GestureMatcher([[UP, RIGHT], [UP], [DOWN, DOWN, DOWN], [UP, LEFT]])
+        self.assertEqual(matcher.findWithin([UP, RIGHT], 1), [(0, (UP, RIGHT)), (1, (UP,)), (1, (UP, LEFT))])
+        self.assertEqual(matcher.findWithin([DOWN], 0), [])
+
+
+class TestBKTreeMatcher(unittest.TestCase):
+    def test_matchesGestureMatcher(self):
+        vocabulary = randomGestures(5, numGestures=300, maxLen=7)
+        matcher = moosegesture.GestureMatcher(vocabulary)
+        bkTree = moosegesture.BKTreeMatcher(vocabulary)
+        pythonMatcher = moosegesture.GestureMatcher(vocabulary)
+        pythonMatcher._vocabularyArray = None
+        for strokes in randomGestures(6, numGestures=100, maxLen=7):
+            for maxDifference in (0, 1, 2):
+                self.assertEqual(pythonMatcher.findWithin(strokes, maxDifference), matcher.findWithin(strokes, maxDifference))
+            for maxDifference in (None, 0, 1, 2, 3):
+                self.assertEqual(bkTree.match(strokes, maxDifference), matcher.match(strokes, maxDifference))
+            for maxDifference in (0, 1, 2):
+                self.assertEqual(bkTree.findWithin(strokes, maxDifference), matcher.findWithin(strokes, maxDifference))
+
+    def test_emptyVocabulary(self):
+        bkTree = moosegesture.BKTreeMatcher([])
+        self.assertEqual(bkTree.match([UP]), None)
+        self.assertEqual(bkTree.findWithin([UP], 2), [])
+
+class TestIdentifyStrokes(unittest.TestCase):
+    def setUp(self):
+        self.minStrokeLen = moosegesture._MIN_STROKE_LEN
+
+    def tearDown(self):
+        moosegesture._MIN_STROKE_LEN = self.minStrokeLen
+
+    def test_matchesBruteForce(self):
+        for minStrokeLen in (1, 20, 60, 150):
+            moosegesture._MIN_STROKE_LEN = minStrokeLen
+            for trace in randomTraces(minStrokeLen, maxLen=80):
+                self.assertEqual(withDirections(moosegesture._identifyStrokes(trace)), identifyStrokesBruteForce(trace, minStrokeLen))
+
+    @unittest.skipIf(moosegesture.numpy is None, 'NumPy is not installed')
+    def test_numpyMatchesBruteForce(self):
+        for minStrokeLen in (1, 20, 60, 150):
+            for trace in randomTraces(minStrokeLen, maxLen=80):
+                self.assertEqual(withDirections(moosegesture._identifyStrokesNumpy(trace, minStrokeLen)), identifyStrokesBruteForce(trace, minStrokeLen))
+
+    @unittest.skipIf(moosegesture.numpy is None, 'NumPy is not installed')
+    def test_numpyTiedWindows(self):
+        # Whole-number distances skip adding up the tied windows, and the
+        # 0.1px moves add them up with a cumsum; both must match Python.
+        for trace in ([(i, 0) for i in range(1000)] + [(999, i) for i in range(1000)],
+                      [(i * 0.1, 0) for i in range(1000)] + [(99.9, i * 0.1) for i in range(1000)]):
+            points = moosegesture.numpy.array(trace)
+            for minStrokeLen in (20, 60, 150):
+                self.assertEqual(moosegesture._identifyStrokesNumpy(points, minStrokeLen),
+                                 moosegesture._identifyStrokesPython([x for x, y in trace], [y for x, y in trace], minStrokeLen))
+
+    def test_exactMinStrokeLen(self):
+        # Windows whose length is exactly _MIN_STROKE_LEN are consistent.
+        moosegesture._MIN_STROKE_LEN = 60
+        trace = [(0, 0), (0, 20), (0, 40), (0, 60), (20, 60), (40, 60), (60, 60), (60, 60)]
+        self.assertEqual(withDirections(moosegesture._identifyStrokes(trace)), identifyStrokesBruteForce(trace, moosegesture._MIN_STROKE_LEN))
+        if moosegesture.numpy is not None:
+            self.assertEqual(withDirections(moosegesture._identifyStrokesNumpy(trace, moosegesture._MIN_STROKE_LEN)), identifyStrokesBruteForce(trace, moosegesture._MIN_STROKE_LEN))
+        self.assertEqual(moosegesture.getGesture(trace), [DOWN, RIGHT])
+
+    def test_wholeNumberDistancesAreLinear(self):
+        # Axis-aligned 1px moves make every window's length an exact tie with
+        # minStrokeLen, which mustn't make every window get added up again.
+        xs = list(range(5000))
+        ys = [0] * len(xs)
+        distances, prefixDistances = moosegesture._pairDistances(xs, ys)
+        directions, runStarts = moosegesture._pairDirections(xs, ys)
+        distances = CountingList(distances)
+        strokes, strokeSegments, numWindows = moosegesture._segmentStrokes(distances, prefixDistances, directions, runStarts, 600)
+        self.assertEqual((moosegesture.codesToDirections(strokes), strokeSegments), ([RIGHT], [[0, 4998]]))
+        self.assertEqual(distances.numLookups, 0)
+
+        trace = [(i, 0) for i in range(100)] + [(99, i) for i in range(100)]
+        self.assertEqual(withDirections(moosegesture._identifyStrokesPython([x for x, y in trace], [y for x, y in trace], 60)),
+                         identifyStrokesBruteForce(trace, 60))
+        recognizer = moosegesture.StrokeRecognizer(trace, minStrokeLen=60)
+        self.assertEqual((recognizer.strokes, recognizer.segments), identifyStrokesBruteForce(trace, 60))
+
+
+class TestIntegerDirection(unittest.TestCase):
+    def test_matchesFloatDirection(self):
+        for xdist in range(-100, 101):
+            for ydist in range(-100, 101):
+                self.assertEqual(moosegesture._integerDirectionCode(xdist, ydist), moosegesture._floatDirectionCode(xdist, ydist))
+
+    def test_thresholds(self):
+        # Slopes exactly on (and one off) the thresholds.
+        for multiple in (1, 3, 1000, 123457):
+            for xdist, ydist in ((10000, 4142), (10000, 4141), (10000, 4143),
+                                 (10000, 24142), (10000, 24141), (10000, 24143)):
+                for xsign in (1, -1):
+                    for ysign in (1, -1):
+                        dx, dy = xsign * xdist * multiple, ysign * ydist * multiple
+                        self.assertEqual(moosegesture._integerDirectionCode(dx, dy), moosegesture._floatDirectionCode(dx, dy))
+                        self.assertEqual(moosegesture._integerDirectionCode(dy, dx), moosegesture._floatDirectionCode(dy, dx))
+
+    def test_largeDeltas(self):
+        rng = random.Random(17)
+        for i in range(20000):
+            bits = rng.randint(1, 40)
+            xdist = rng.randint(-2 ** bits, 2 ** bits)
+            ydist = rng.randint(-2 ** bits, 2 ** bits)
+            self.assertEqual(moosegesture._integerDirectionCode(xdist, ydist), moosegesture._floatDirectionCode(xdist, ydist))
+
+
+class TestDirectionCodes(unittest.TestCase):
+    def test_codesMatchDirections(self):
+        moosegesture._MIN_STROKE_LEN = 60
+        for trace in randomTraces(18, maxLen=150):
+            gesture = moosegesture.getGesture(trace)
+            codes = moosegesture.getGesture(trace, codes=True)
+            self.assertTrue(all(isinstance(code, int) for code in codes))
+            self.assertEqual(moosegesture.codesToDirections(codes), gesture)
+            self.assertEqual(moosegesture.directionsToCodes(gesture), codes)
+            self.assertEqual(moosegesture.getGestureAndSegments(trace, codes=True), list(zip(codes, moosegesture.getSegments(trace))))
+
+    def test_keypadLayout(self):
+        self.assertEqual(moosegesture.directionsToCodes([DOWNLEFT, DOWN, DOWNRIGHT, LEFT, RIGHT, UPLEFT, UP, UPRIGHT]), [1, 2, 3, 4, 6, 7, 8, 9])
+        self.assertEqual(moosegesture.getGesture([(0, 0), (0, -40), (0, -80), (0, -120), (40, -120), (80, -120), (120, -120)], codes=True), [8, 6])
+
+    def test_strokeRecognizer(self):
+        recognizer = moosegesture.StrokeRecognizer([(332, 385), (332, 287), (332, 175), (330, 69), (324, 13), (322, 0)], minStrokeLen=60)
+        self.assertEqual(recognizer.strokeCodes, [8])
+        self.assertEqual(recognizer.strokes, [UP])
+
+    def test_getGestures(self):
+        traces = randomTraces(19, numTraces=20, maxLen=60)
+        recognizer = moosegesture.GestureRecognizer(minStrokeLen=60)
+        expected = [recognizer.getGesture(trace, codes=True) for trace in traces]
+        self.assertEqual(recognizer.getGestures(traces, workers=1, codes=True), expected)
+        self.assertEqual(recognizer.getGestures(traces, workers=2, chunksize=4, codes=True), expected)
+
+
+    def test_matchingCodes(self):
+        vocabulary = [[UP, RIGHT], [DOWN], [LEFT, UP, RIGHT], [UPLEFT, DOWNRIGHT]]
+        codeVocabulary = [moosegesture.directionsToCodes(gesture) for gesture in vocabulary]
+        recognizer = moosegesture.GestureRecognizer(minStrokeLen=60)
+        for gesture in vocabulary + [[UP], [LEFT, RIGHT]]:
+            points = moosegesture.syntheticTrace(gesture, minStrokeLen=60).points
+            codes = recognizer.getGesture(points, codes=True)
+            expected = moosegesture.findClosestMatchingGesture(gesture, vocabulary)
+            self.assertEqual(moosegesture.findClosestMatchingGesture(codes, vocabulary), expected)
+            self.assertEqual(moosegesture.GestureMatcher(vocabulary).match(codes), expected)
+            self.assertEqual(moosegesture.findKClosestGestures(codes, vocabulary, 2), moosegesture.findKClosestGestures(gesture, vocabulary, 2))
+            self.assertEqual(moosegesture.BKTreeMatcher(vocabulary).match(codes), expected)
+            self.assertEqual(moosegesture.GestureTrie(vocabulary).reachable(codes[:1]), moosegesture.GestureTrie(vocabulary).reachable(gesture[:1]))
+            # A vocabulary of codes matches codes and strings alike.
+            self.assertEqual(moosegesture.GestureMatcher(codeVocabulary).match(gesture),
+                             moosegesture.GestureMatcher(codeVocabulary).match(codes))
+            for other in vocabulary:
+                self.assertEqual(moosegesture.levenshteinDistance(codes, moosegesture.directionsToCodes(other)),
+                                 moosegesture.levenshteinDistance(gesture, other))
+        self.assertTrue(moosegesture.GestureTrie(vocabulary).isDeadPrefix(['X']))
+
+    def test_equivalentGestures(self):
+        # A gesture of directions and the same gesture of codes are both
+        # returned, whether they match exactly or not.
+        vocabulary = [[UP], [8], [DOWN, DOWN]]
+        for matcher in (moosegesture.GestureMatcher(vocabulary), moosegesture.BKTreeMatcher(vocabulary)):
+            self.assertEqual(matcher.match([UP]), ((UP,), (8,)))
+            self.assertEqual(matcher.match([8], maxDifference=0), ((UP,), (8,)))
+            self.assertEqual(matcher.match([UP, LEFT]), ((UP,), (8,)))
+            self.assertEqual(matcher.match([UP], maxDifference=-1), None)
+        self.assertEqual(moosegesture.findClosestMatchingGesture([UP], vocabulary), ((UP,), (8,)))
+        self.assertEqual(moosegesture.findClosestMatchingGesture([UP], vocabulary, maxDifference=-1), None)
+
+class TestSyntheticTraces(unittest.TestCase):
+    def test_recognizedAsGroundTruth(self):
+        rng = random.Random(20)
+        directions = [UP, DOWN, LEFT, RIGHT, UPLEFT, UPRIGHT, DOWNLEFT, DOWNRIGHT]
+        for i in range(200):
+            gesture = []
+            for j in range(rng.randint(1, 8)):
+                gesture.append(rng.choice([direction for direction in directions if not gesture or direction != gesture[-1]]))
+            for options in ({}, {'integer': False}, {'overshoot': 0.5}, {'speed': 3000}):
+                trace = moosegesture.syntheticTrace(gesture, seed=i, minStrokeLen=60, **options)
+                self.assertEqual(trace.gesture, gesture)
+                self.assertEqual(moosegesture.GestureRecognizer(minStrokeLen=60).getGesture(trace.points), gesture)
+
+    def test_options(self):
+        trace = moosegesture.syntheticTrace([RIGHT], sampleRate=100, speed=1000, strokeLength=2, minStrokeLen=60, start=(5, 7))
+        self.assertEqual(trace.points, [(5 + 10 * i, 7) for i in range(13)])
+        jittered = moosegesture.syntheticTrace([RIGHT], seed=1, jitter=2, strokeLength=2, integer=False).points
+        self.assertEqual(len(jittered), len(moosegesture.syntheticTrace([RIGHT], strokeLength=2).points))
+        self.assertTrue(any(y != 0 for x, y in jittered))
+
+    def test_invalidGestures(self):
+        self.assertRaises(ValueError, moosegesture.syntheticTrace, [UP, 'X'])
+        self.assertRaises(ValueError, moosegesture.syntheticTrace, [UP, UP])
+        self.assertRaises(ValueError, moosegesture.syntheticTrace, [UP], speed=0)
+        self.assertRaises(ValueError, moosegesture.syntheticTrace, [UP], speed=-800)
+        self.assertRaises(ValueError, moosegesture.syntheticTrace, [UP], sampleRate=0)
+
+    def test_seededAndLazy(self):
+        gestures = [[UP, RIGHT], [DOWNLEFT], [LEFT, UP, RIGHT, DOWN]]
+        options = {'jitter': 1.0, 'overshoot': 0.3}
+        first = list(moosegesture.syntheticTraces(gestures, 50, seed=3, **options))
+        self.assertEqual(first, list(moosegesture.syntheticTraces(gestures, 50, seed=3, **options)))
+        self.assertNotEqual(first, list(moosegesture.syntheticTraces(gestures, 50, seed=4, **options)))
+        endless = moosegesture.syntheticTraces(gestures, seed=3, **options)
+        self.assertEqual([next(endless) for i in range(50)], first)
+
+
+class TestStats(unittest.TestCase):
+    def tearDown(self):
+        moosegesture.disableStats()
+
+    def test_disabledByDefault(self):
+        self.assertEqual(moosegesture.disableStats(), None)
+
+    def test_sameResults(self):
+        traces = randomTraces(21, numTraces=100, maxLen=200)
+        for recognizer in (moosegesture.GestureRecognizer(minStrokeLen=60), moosegesture.GestureRecognizer(minStrokeLen=60, useNumpy=False)):
+            expected = [recognizer.getGestureAndSegments(trace) for trace in traces]
+            stats = moosegesture.enableStats()
+            self.assertEqual([recognizer.getGestureAndSegments(trace) for trace in traces], expected)
+            self.assertIs(moosegesture.disableStats(), stats)
+            self.assertEqual(stats.calls['identifyStrokes'], len(traces))
+            self.assertEqual(stats.counts['points'], sum([len(trace) for trace in traces]))
+            self.assertEqual(stats.counts['directions'], sum([max(len(trace) - 1, 0) for trace in traces]))
+            self.assertTrue(0 < stats.counts['windows'] <= stats.counts['directions'])
+
+    def test_counts(self):
+        stats = moosegesture.enableStats()
+        trace = [(0, 0), (0, 20), (0, 40), (0, 60), (20, 60), (40, 60), (60, 60)]
+        moosegesture.GestureRecognizer(minStrokeLen=60, useNumpy=False).getGesture(trace)
+        self.assertEqual(stats.counts['points'], 7)
+        self.assertEqual(stats.counts['directions'], 6)
+        self.assertEqual(stats.counts['windows'], 5) # the fifth window is the first that never reaches minStrokeLen
+
+        stats.reset()
+        matcher = moosegesture.GestureMatcher([[UP, DOWN], [LEFT, RIGHT, UP]])
+        self.assertEqual(matcher.match([UP, DOWN, LEFT]), ((UP, DOWN),))
+        self.assertEqual(matcher.match([UP, DOWN]), ((UP, DOWN),)) # exact matches don't calculate any distances
+        self.assertEqual(stats.calls, {'identifyStrokes': 0, 'match': 2, 'findWithin': 0, 'kClosest': 0})
+        self.assertEqual(stats.counts['levenshteinDistances'], 2)
+        # all 3 * 2 cells of the first distance, then only the band within 1 of the diagonal
+        self.assertEqual(stats.counts['levenshteinCells'], 3 * 2 + 2 + 3)
+        self.assertTrue(stats.seconds['matching'] > 0)
+
+    def test_otherMatchingCalls(self):
+        gestures = [[UP, DOWN], [LEFT, RIGHT, UP], [UP]]
+        for matcher in (moosegesture.GestureMatcher(gestures), moosegesture.BKTreeMatcher(gestures)):
+            stats = moosegesture.enableStats()
+            self.assertEqual(matcher.findWithin([UP, DOWN, LEFT], 1), [(1, (UP, DOWN))])
+            self.assertEqual(matcher.kClosest([UP, DOWN, LEFT], 2), [(1, (UP, DOWN)), (2, (UP,))])
+            self.assertEqual(stats.calls['findWithin'], 1)
+            self.assertEqual(stats.calls['kClosest'], 1)
+            self.assertTrue(stats.counts['levenshteinDistances'] > 0)
+            self.assertTrue(stats.counts['levenshteinCells'] > 0)
+
+        stats = moosegesture.enableStats()
+        self.assertEqual(moosegesture.findKClosestGestures([UP, DOWN, LEFT], gestures, 1), [(1, (UP, DOWN))])
+        self.assertEqual(stats.calls['kClosest'], 1)
+        self.assertTrue(stats.counts['levenshteinDistances'] > 0)
+
+    def test_disabledWhileMatching(self):
+        class DisablingMatcher(moosegesture.BKTreeMatcher):
+            def _closest(self, *args):
+                moosegesture.disableStats() # as if another thread disabled them
+                return moosegesture.BKTreeMatcher._closest(self, *args)
+        matcher = DisablingMatcher([[UP, DOWN], [LEFT, RIGHT, UP]])
+        stats = moosegesture.enableStats()
+        self.assertEqual(matcher.match([UP, DOWN, LEFT]), ((UP, DOWN),))
+        self.assertEqual(stats.calls['match'], 1)
+
+    def test_numpyCells(self):
+        if moosegesture._moosegesture_numpy is None:
+            self.skipTest('NumPy is not installed')
+        class NumpyMatcher(moosegesture.GestureMatcher):
+            _numpyMinGestures = 1
+        matcher = NumpyMatcher([[UP, DOWN], [LEFT, RIGHT, UP]])
+        stats = moosegesture.enableStats()
+        matcher.match([UP, DOWN, LEFT])
+        # both gestures are calculated, with the shorter one padded to 3 codes
+        self.assertEqual(stats.counts['levenshteinDistances'], 2)
+        self.assertEqual(stats.counts['levenshteinCells'], 3 * 2 * 3)
+
+    def test_callback(self):
+        calls = []
+        moosegesture.enableStats(lambda operation, seconds, counts: calls.append((operation, sorted(seconds), counts)))
+        moosegesture.GestureRecognizer(minStrokeLen=60, useNumpy=False).getGesture([(0, 0), (0, 100)])
+        self.assertEqual(calls, [('identifyStrokes', ['direction', 'distance', 'segmentation'], {'points': 2, 'directions': 1, 'windows': 1})])
+
+
+class AsyncPoints(object):
+    # An async iterator of points, written without async syntax so that this
+    # file can still be imported by Python 2.
+    def __init__(self, points):
+        self.points = iter(points)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        import asyncio
+        try:
+            point = next(self.points)
+        except StopIteration:
+            raise StopAsyncIteration
+        return asyncio.sleep(0, result=point)
+
+
+def collectAsync(asyncIterator, onItem=None):
+    # Returns a list of the items of `asyncIterator`, calling onItem(item) as
+    # each one arrives.
+    import asyncio
+    loop = asyncio.new_event_loop()
+    items = []
+    try:
+        while True:
+            try:
+                items.append(loop.run_until_complete(asyncIterator.__anext__()))
+                if onItem is not None:
+                    onItem(items[-1])
+            except StopAsyncIteration:
+                return items
+    finally:
+        loop.close()
+
+
+@unittest.skipIf(sys.version_info < (3, 6), 'astrokes() requires Python 3.6')
+class TestAsyncStrokes(unittest.TestCase):
+    def test_matchesGetGestureAndSegments(self):
+        for minPointDistance in (None, 0):
+            recognizer = moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=minPointDistance)
+            for trace in randomTraces(22, numTraces=100, maxLen=80):
+                self.assertEqual(collectAsync(moosegesture.astrokes(AsyncPoints(trace), recognizer)), recognizer.getGestureAndSegments(trace))
+                self.assertEqual(collectAsync(moosegesture.astrokes(AsyncPoints(trace), recognizer, codes=True)), recognizer.getGestureAndSegments(trace, codes=True))
+
+    def test_yieldsFinishedStrokes(self):
+        # Each stroke is yielded once the next one starts, before the points run out.
+        trace = moosegesture.syntheticTrace([UP, RIGHT, DOWN], minStrokeLen=60).points
+        numAdded = [0]
+        def points():
+            for point in trace:
+                numAdded[0] += 1
+                yield point
+        strokes = moosegesture.astrokes(AsyncPoints(points()), moosegesture.GestureRecognizer(minStrokeLen=60))
+        yielded = []
+        collectAsync(strokes, lambda stroke: yielded.append((stroke[0], numAdded[0])))
+        self.assertEqual([direction for direction, numPoints in yielded], [UP, RIGHT, DOWN])
+        self.assertTrue(yielded[0][1] < yielded[1][1] < len(trace))
+        self.assertEqual(yielded[2][1], len(trace))
+
+
+class TestStrokeRecognizer(unittest.TestCase):
+    def test_matchesIdentifyStrokesForEveryPrefix(self):
+        moosegesture._MIN_STROKE_LEN = 60
+        for trace in randomTraces(1):
+            recognizer = moosegesture.StrokeRecognizer()
+            for i in range(len(trace)):
+                recognizer.addPoint(*trace[i])
+                self.assertEqual((recognizer.strokes, recognizer.segments), identifyStrokesBruteForce(trace[:i+1], 60))
+
+    def test_reset(self):
+        moosegesture._MIN_STROKE_LEN = 60
+        recognizer = moosegesture.StrokeRecognizer([(332, 385), (332, 287), (332, 175), (330, 69), (324, 13), (322, 0)])
+        self.assertEqual(recognizer.strokes, [UP])
+        self.assertEqual(recognizer.segments, [[3, 4]])
+        recognizer.reset()
+        self.assertEqual((recognizer.strokes, recognizer.segments), ([], []))
+
+
+class TestStrokeCallbacks(unittest.TestCase):
+    def test_eventsMatchStrokes(self):
+        for minPointDistance in (None, 0, 5):
+            recognizer = moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=minPointDistance)
+            for trace in randomTraces(23, numTraces=100, maxLen=80):
+                started, ended, latest = [], [], [None]
+                def onStrokeStart(direction, segment):
+                    started.append(direction)
+                    latest[0] = (direction, segment)
+                def onStrokeExtended(direction, segment):
+                    self.assertEqual(direction, started[-1])
+                    self.assertTrue(segment[1] > latest[0][1][1])
+                    latest[0] = (direction, segment)
+                strokeRecognizer = recognizer.strokeRecognizer(onStrokeStart, onStrokeExtended, lambda direction, segment: ended.append((direction, segment)))
+                for i in range(len(trace)):
+                    strokeRecognizer.addPoint(*trace[i])
+                    self.assertEqual(started, strokeRecognizer.strokes)
+                    if started:
+                        self.assertEqual(latest[0], (started[-1], strokeRecognizer.segments[-1]))
+                    self.assertEqual(ended, recognizer.getGestureAndSegments(trace[:i+1])[:max(len(started) - 1, 0)])
+                strokeRecognizer.finish()
+                strokeRecognizer.finish()
+                self.assertEqual(ended, recognizer.getGestureAndSegments(trace))
+
+    def test_reset(self):
+        events = []
+        recognizer = moosegesture.StrokeRecognizer(minStrokeLen=60, onStrokeStart=lambda direction, segment: events.append(('start', direction)),
+                                                   onStrokeEnd=lambda direction, segment: events.append(('end', direction)))
+        for x, y in moosegesture.syntheticTrace([UP, RIGHT], minStrokeLen=60).points:
+            recognizer.addPoint(x, y)
+        recognizer.finish()
+        recognizer.reset()
+        for x, y in moosegesture.syntheticTrace([DOWN], minStrokeLen=60).points:
+            recognizer.addPoint(x, y)
+        recognizer.finish()
+        self.assertEqual(events, [('start', UP), ('end', UP), ('start', RIGHT), ('end', RIGHT), ('start', DOWN), ('end', DOWN)])
+
+
+class TestMultiStreamRecognizer(unittest.TestCase):
+    def interleavedEvents(self, traces, rng):
+        # Returns the points of all the traces as (streamId, x, y) events, in
+        # a random order that keeps each trace's points in order.
+        positions = [0] * len(traces)
+        remaining = [i for i in range(len(traces)) if traces[i]]
+        events = []
+        while remaining:
+            streamId = rng.choice(remaining)
+            x, y = traces[streamId][positions[streamId]]
+            events.append((streamId, x, y))
+            positions[streamId] += 1
+            if positions[streamId] == len(traces[streamId]):
+                remaining.remove(streamId)
+        return events
+
+    def test_matchesGetGesture(self):
+        rng = random.Random(24)
+        traces = randomTraces(24, numTraces=200, maxLen=80)
+        events = self.interleavedEvents(traces, rng)
+        for useNumpy in (True, False):
+            recognizer = moosegesture.GestureRecognizer(minStrokeLen=60, useNumpy=useNumpy)
+            for compactMinPoints in (moosegesture.MultiStreamRecognizer._compactMinPoints, 16):
+                streams = moosegesture.MultiStreamRecognizer(recognizer, idleTimeout=10)
+                streams._compactMinPoints = compactMinPoints
+                for i in range(0, len(events), 97):
+                    self.assertEqual(streams.addEvents(events[i:i + 97], now=0), {})
+                self.assertEqual(len(streams), len([trace for trace in traces if trace]))
+                gestures = {}
+                for streamId in range(len(traces)):
+                    if streamId % 2:
+                        gestures[streamId] = streams.endStream(streamId)
+                        self.assertFalse(streamId in streams)
+                # The ended streams' points are compacted away, and the rest
+                # still have all their points.
+                if compactMinPoints == 16:
+                    self.assertTrue(len(streams._xs) < len(events))
+                gestures.update(streams.evictIdle(now=11))
+                self.assertEqual(len(streams), 0)
+                for streamId in range(len(traces)):
+                    self.assertEqual(gestures.get(streamId), recognizer.getGesture(traces[streamId]) if traces[streamId] else None)
+
+    def test_idleTimeout(self):
+        now = [0.0]
+        streams = moosegesture.MultiStreamRecognizer(moosegesture.GestureRecognizer(minStrokeLen=60), idleTimeout=5, codes=True, clock=lambda: now[0])
+        up = moosegesture.syntheticTrace([UP], minStrokeLen=60).points
+        right = moosegesture.syntheticTrace([RIGHT], minStrokeLen=60).points
+        streams.addEvents([('a', x, y) for x, y in up] + [('b', x, y) for x, y in up])
+        now[0] = 4.0
+        self.assertEqual(streams.addEvents([('b', x, y) for x, y in up[-1:]]), {})
+        now[0] = 8.0
+        # Stream 'a' is evicted when it is checked, and stream 'b' isn't idle yet.
+        self.assertEqual(streams.addEvents([]), {'a': [8]})
+        self.assertEqual(len(streams), 1)
+        now[0] = 20.0
+        # An event for an idle stream ends its gesture and starts a new one.
+        self.assertEqual(streams.addEvents([('b', x, y) for x, y in right]), {'b': [8]})
+        self.assertEqual(streams.endStream('b'), [6])
+        self.assertEqual(streams.endStream('b'), None)
+
+
+class TestGestureServer(unittest.TestCase):
+    def setUp(self):
+        self.server = moosegesture.server.GestureServer(('127.0.0.1', 0), moosegesture.GestureRecognizer(minStrokeLen=60),
+                                                        [[UP], [UP, RIGHT], [DOWN]], maxDifference=0, batchDelay=0.01)
+        self.thread = threading.Thread(target=self.server.serveForever)
+        self.thread.start()
+        self.client = moosegesture.server.GestureClient(self.server.address)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.thread.join()
+
+    def test_request(self):
+        upRight = moosegesture.syntheticTrace([UP, RIGHT], minStrokeLen=60).points
+        left = moosegesture.syntheticTrace([LEFT], minStrokeLen=60).points
+        flat = [coordinate for point in upRight for coordinate in point]
+        response = self.client.request([flat, [list(point) for point in left], []])
+        self.assertEqual(response, {'id': 1, 'gestures': [[UP, RIGHT], [LEFT], []],
+                                    'matches': [[[UP, RIGHT]], None, None]})
+
+    def test_invalidRequest(self):
+        self.assertIn('error', self.client.request([[1, 2, 3]]))
+        self.assertIn('error', self.client.request([None]))
+        self.assertEqual(self.client.request([[0, 0, 0, 50, 0, 100]])['gestures'], [[DOWN]]) # the connection still works
+
+    def test_loadTest(self):
+        result = moosegesture.server.runLoadTest(self.server.address, connections=3, requests=5, tracesPerRequest=4)
+        self.assertEqual((result['requests'], result['traces'], result['errors']), (15, 60, 0))
+        self.assertTrue(0 < result['p50LatencyMs'] <= result['p99LatencyMs'])
+
+    @unittest.skipIf(not hasattr(moosegesture.server.socket, 'AF_UNIX'), 'Unix sockets are not supported')
+    def test_unixSocketRestart(self):
+        import socket
+        import tempfile
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'moosegesture.sock')
+        try:
+            # A socket file left behind by a server that exited is removed.
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(path)
+            stale.close()
+            for i in range(2):
+                server = moosegesture.server.GestureServer(path)
+                thread = threading.Thread(target=server.serveForever)
+                thread.start()
+                client = moosegesture.server.GestureClient(path)
+                self.assertEqual(client.request([[0, 0, 0, 50, 0, 100]])['gestures'], [[DOWN]])
+                client.close()
+                server.shutdown()
+                thread.join()
+                self.assertFalse(os.path.exists(path))
+        finally:
+            import shutil
+            shutil.rmtree(directory)
+
+    def test_percentile(self):
+        self.assertEqual(moosegesture.server._percentile(list(range(1, 101)), 0.99), 99)
+        self.assertEqual(moosegesture.server._percentile([5], 0.5), 5)
+        self.assertEqual(moosegesture.server._percentile([], 0.99), 0.0)
+
+
+class TestDecimation(unittest.TestCase):
+    def test_noRepeatedPointsIsExact(self):
+        recognizer = moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=0)
+        for trace in randomTraces(12):
+            trace = [trace[i] for i in range(len(trace)) if i == 0 or trace[i] != trace[i-1]]
+            self.assertEqual(recognizer.getGestureAndSegments(trace), moosegesture.GestureRecognizer(minStrokeLen=60).getGestureAndSegments(trace))
+
+    def test_repeatedPoints(self):
+        trace = [(0, 0), (0, 20), (0, 40), (0, 40), (0, 60), (0, 80), (0, 100), (0, 100)]
+        # The repeated point keeps the windows that start before it from being consistent.
+        self.assertEqual(moosegesture.GestureRecognizer(minStrokeLen=60).getGestureAndSegments(trace), [(DOWN, [2, 6])])
+        self.assertEqual(moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=0).getGestureAndSegments(trace), [(DOWN, [0, 5])])
+
+    def test_resample(self):
+        # A high-rate trace of 1 pixel moves, which alternate between straight and diagonal.
+        trace = [(0, 0)]
+        for i in range(200):
+            x, y = trace[-1]
+            trace.append((x + 1, y + i % 2))
+        self.assertEqual(moosegesture.GestureRecognizer(minStrokeLen=60).getGesture(trace), [])
+        recognizer = moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=8)
+        self.assertEqual(recognizer.getGesture(trace), [DOWNRIGHT])
+        start, end = recognizer.getSegments(trace)[0]
+        self.assertTrue(0 <= start <= end < len(trace) - 1)
+
+    def test_bufferInput(self):
+        traces = randomTraces(16, numTraces=50, maxLen=400)
+        for recognizer in (moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=5),
+                           moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=5, useNumpy=False)):
+            for trace in traces:
+                expected = recognizer.getGestureAndSegments(trace)
+                flat = array.array('d', [coordinate for point in trace for coordinate in point])
+                self.assertEqual(recognizer.getGestureAndSegments(flat), expected)
+                if moosegesture.numpy is not None:
+                    self.assertEqual(recognizer.getGestureAndSegments(moosegesture.numpy.array(trace)), expected)
+        self.assertEqual([moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=5).getGestureAndSegments(trace) for trace in traces],
+                         [moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=5, useNumpy=False).getGestureAndSegments(trace) for trace in traces])
+
+    def test_stats(self):
+        recognizer = moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=0)
+        trace = [(0, 0), (0, 20), (0, 20), (0, 40), (0, 60), (0, 80)]
+        stats = moosegesture.enableStats()
+        try:
+            self.assertEqual(recognizer.getGesture(trace), [DOWN])
+        finally:
+            moosegesture.disableStats()
+        self.assertEqual(stats.calls['identifyStrokes'], 1)
+        self.assertEqual(stats.counts['points'], 5) # the repeated point is dropped
+
+    def test_strokeRecognizerMatchesGestureRecognizer(self):
+        for minPointDistance in (0, 5):
+            recognizer = moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=minPointDistance)
+            for trace in randomTraces(13, numTraces=100):
+                strokeRecognizer = recognizer.strokeRecognizer()
+                for i in range(len(trace)):
+                    strokeRecognizer.addPoint(*trace[i])
+                    self.assertEqual((strokeRecognizer.strokeCodes, strokeRecognizer.segments), recognizer._identifyStrokes(trace[:i+1]))
+
+
+class TestBufferInput(unittest.TestCase):
+    def test_matchesTuples(self):
+        for recognizer in (moosegesture.GestureRecognizer(minStrokeLen=60), moosegesture.GestureRecognizer(minStrokeLen=60, useNumpy=False)):
+            for trace in randomTraces(14, numTraces=100, maxLen=150):
+                expected = recognizer.getGestureAndSegments(trace)
+                flat = array.array('d', [coordinate for point in trace for coordinate in point])
+                self.assertEqual(recognizer.getGestureAndSegments(flat), expected)
+                self.assertEqual(recognizer.getGestureAndSegments(memoryview(flat)), expected)
+                if moosegesture.numpy is not None:
+                    self.assertEqual(recognizer.getGestureAndSegments(moosegesture.numpy.array(trace).reshape(-1, 2)), expected)
+
+    def test_integerBuffer(self):
+        moosegesture._MIN_STROKE_LEN = 60
+        points = array.array('i', [332, 385, 332, 287, 332, 175, 330, 69, 324, 13, 322, 0])
+        self.assertEqual(moosegesture.getGesture(points), [UP])
+        self.assertEqual(moosegesture.getSegments(points), [[3, 4]])
+        self.assertEqual(moosegesture.getGestureAndSegments(points), [(UP, [3, 4])])
+        self.assertEqual(moosegesture.getGestures([points, points], workers=2), [[UP], [UP]])
+        self.assertRaises(ValueError, moosegesture.GestureRecognizer(useNumpy=False).getGesture, points[:-1])
+
+
+    @unittest.skipIf(moosegesture.numpy is None, 'NumPy is not installed')
+    def test_shortBuffersSkipNumpy(self):
+        usedNumpy = []
+        identifyStrokesArray = moosegesture._identifyStrokesArray
+        def countingIdentifyStrokesArray(points, minStrokeLen):
+            usedNumpy.append(len(points))
+            return identifyStrokesArray(points, minStrokeLen)
+        moosegesture._identifyStrokesArray = countingIdentifyStrokesArray
+        try:
+            trace = [(0, 0), (0, 50), (0, 100), (50, 100), (100, 100)]
+            flat = array.array('d', [coordinate for point in trace for coordinate in point])
+            recognizer = moosegesture.GestureRecognizer(minStrokeLen=60)
+            self.assertEqual(recognizer.getGesture(flat), [DOWN, RIGHT])
+            self.assertEqual(recognizer.getGesture(memoryview(flat)[4:]), [RIGHT])
+            self.assertEqual(usedNumpy, []) # short buffers use the pure Python implementation
+            self.assertEqual(recognizer.getGesture(moosegesture.numpy.array(trace)), [DOWN, RIGHT])
+            self.assertEqual(usedNumpy, [5]) # but NumPy arrays don't need converting
+            longFlat = flat * 100
+            recognizer.getGesture(longFlat)
+            self.assertEqual(usedNumpy, [5, 500])
+        finally:
+            moosegesture._identifyStrokesArray = identifyStrokesArray
+
+    @unittest.skipIf(moosegesture.numpy is None, 'NumPy is not installed')
+    def test_nonContiguousArrays(self):
+        numpy = moosegesture.numpy
+        trace = randomTraces(15, numTraces=1, maxLen=150)[0] + [(0, 0), (0, 200)]
+        points = numpy.array(trace)
+        wide = numpy.hstack([points, points])
+        arrays = [numpy.asfortranarray(points), wide[:, :2], wide[:, 2:], points.astype(numpy.float16)]
+        for recognizer in (moosegesture.GestureRecognizer(minStrokeLen=60), moosegesture.GestureRecognizer(minStrokeLen=60, useNumpy=False),
+                           moosegesture.GestureRecognizer(minStrokeLen=60, minPointDistance=0)):
+            expected = recognizer.getGestureAndSegments([(float(x), float(y)) for x, y in points.astype(numpy.float16).tolist()])
+            for array_ in arrays[:3]:
+                self.assertEqual(recognizer.getGestureAndSegments(array_), recognizer.getGestureAndSegments(trace))
+            self.assertEqual(recognizer.getGestureAndSegments(arrays[3]), expected)
+        self.assertEqual(moosegesture.getGestures(arrays[:3], workers=1), [moosegesture.getGesture(trace)] * 3)
+
+        # Without NumPy, non-contiguous buffers are copied with tolist().
+        numpyBackend = moosegesture._moosegesture_numpy
+        moosegesture._moosegesture_numpy = None
+        try:
+            recognizer = moosegesture.GestureRecognizer(minStrokeLen=60, useNumpy=False)
+            for array_ in arrays[:3]:
+                self.assertEqual(recognizer.getGestureAndSegments(array_), recognizer.getGestureAndSegments(trace))
+            self.assertRaises(ValueError, recognizer.getGesture, numpy.arange(10)[::2])
+        finally:
+            moosegesture._moosegesture_numpy = numpyBackend
+
+
+class TestGetGestures(unittest.TestCase):
+    def setUp(self):
+        self.minStrokeLen = moosegesture._MIN_STROKE_LEN
+
+    def tearDown(self):
+        moosegesture._MIN_STROKE_LEN = self.minStrokeLen
+
+    def test_matchesGetGesture(self):
+        moosegesture._MIN_STROKE_LEN = 60
+        traces = randomTraces(2, numTraces=200)
+        expected = [moosegesture.getGesture(trace) for trace in traces]
+        self.assertEqual(moosegesture.getGestures(traces, workers=1), expected)
+        self.assertEqual(moosegesture.getGestures(traces, workers=2, chunksize=7), expected)
+
+    def test_usesCurrentMinStrokeLen(self):
+        traces = randomTraces(3, numTraces=50)
+        moosegesture._MIN_STROKE_LEN = 20
+        expected = [moosegesture.getGesture(trace) for trace in traces]
+        self.assertEqual(moosegesture.getGestures(traces, workers=2), expected)
+
+
+class TestGestureRecognizer(unittest.TestCase):
+    def setUp(self):
+        self.minStrokeLen = moosegesture._MIN_STROKE_LEN
+
+    def tearDown(self):
+        moosegesture._MIN_STROKE_LEN = self.minStrokeLen
+
+    def test_matchesModuleFunctions(self):
+        for minStrokeLen in (20, 60):
+            moosegesture._MIN_STROKE_LEN = minStrokeLen
+            recognizer = moosegesture.GestureRecognizer(minStrokeLen=minStrokeLen)
+            for trace in randomTraces(4):
+                self.assertEqual(recognizer.getGesture(trace), moosegesture.getGesture(trace))
+                self.assertEqual(recognizer.getSegments(trace), moosegesture.getSegments(trace))
+                self.assertEqual(recognizer.getGestureAndSegments(trace), moosegesture.getGestureAndSegments(trace))
+
+    def test_immutable(self):
+        recognizer = moosegesture.GestureRecognizer(minStrokeLen=40)
+        self.assertRaises(AttributeError, setattr, recognizer, 'minStrokeLen', 60)
+        self.assertRaises(AttributeError, setattr, recognizer, '_minStrokeLen', 60)
+        self.assertEqual(recognizer.minStrokeLen, 40)
+        self.assertEqual(pickle.loads(pickle.dumps(recognizer)).minStrokeLen, 40)
+
+    def test_concurrentThresholds(self):
+        traces = randomTraces(5, numTraces=100)
+        recognizers = [moosegesture.GestureRecognizer(minStrokeLen=minStrokeLen) for minStrokeLen in (10, 30, 60, 90)]
+        expected = [[recognizer.getGesture(trace) for trace in traces] for recognizer in recognizers]
+        results = [None] * len(recognizers)
+
+        def recognizeAll(i):
+            results[i] = [recognizers[i].getGesture(trace) for trace in traces]
+
+        threads = [threading.Thread(target=recognizeAll, args=(i,)) for i in range(len(recognizers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, expected)
+
+
+class TestMatchCache(unittest.TestCase):
+    def test_lruEviction(self):
+        cache = moosegesture.LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1) # 'b' is now the least recently used
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.info(), moosegesture.CacheInfo(hits=2, misses=1, evictions=1, maxsize=2, currsize=2))
+        cache.resize(1)
+        self.assertEqual(cache.info().evictions, 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_matcherCache(self):
+        cache = moosegesture.LRUCache(maxsize=10)
+        matcher = moosegesture.GestureMatcher([[DOWN, LEFT, DOWN], [DOWN, RIGHT, UPRIGHT]], cache=cache)
+        for i in range(3):
+            self.assertEqual(matcher.match([DOWN, LEFT, RIGHT]), ((DOWN, LEFT, DOWN),))
+        self.assertEqual(matcher.match([UP], maxDifference=1), None)
+        self.assertEqual(matcher.match([UP], maxDifference=1), None)
+        self.assertEqual((cache.hits, cache.misses), (3, 2))
+
+    def test_findClosestInvalidatesOnVocabularyChange(self):
+        gestures = [[DOWN, LEFT, DOWN], [DOWN, RIGHT, UPRIGHT]]
+        self.assertEqual(moosegesture.findClosestMatchingGesture([DOWN, LEFT, RIGHT], gestures), ((DOWN, LEFT, DOWN),))
+        hits = moosegesture.matchCache.hits
+        self.assertEqual(moosegesture.findClosestMatchingGesture([DOWN, LEFT, RIGHT], gestures), ((DOWN, LEFT, DOWN),))
+        self.assertEqual(moosegesture.matchCache.hits, hits + 1)
+        gestures[0] = [UP]
+        self.assertEqual(moosegesture.findClosestMatchingGesture([DOWN, LEFT, RIGHT], gestures), ((DOWN, RIGHT, UPRIGHT),))
+        self.assertEqual(moosegesture.matchCache.hits, hits + 1)
+
+    def test_findClosestGestureChangedInPlace(self):
+        gestures = [[UP], [DOWN, RIGHT]]
+        self.assertEqual(moosegesture.findClosestMatchingGesture([LEFT, LEFT], gestures), ((UP,), (DOWN, RIGHT)))
+        gestures[0][:] = [LEFT, LEFT]
+        self.assertEqual(moosegesture.findClosestMatchingGesture([LEFT, LEFT], gestures), ((LEFT, LEFT),))
+        gestures[0].append(UP)
+        self.assertEqual(moosegesture.findClosestMatchingGesture([LEFT, LEFT, DOWN], gestures), ((LEFT, LEFT, UP),))
+
+    def test_findClosestNewListsShareResults(self):
+        matcher = moosegesture._matcherFor([[UP, LEFT], [DOWN, RIGHT, DOWN]])
+        hits = moosegesture.matchCache.hits
+        for i in range(3):
+            self.assertEqual(moosegesture.findClosestMatchingGesture([UP, UP], [[UP, LEFT], [DOWN, RIGHT, DOWN]]), ((UP, LEFT),))
+        self.assertIs(moosegesture._matcherFor([[UP, LEFT], [DOWN, RIGHT, DOWN]]), matcher)
+        self.assertEqual(moosegesture.matchCache.hits, hits + 2)
+
+        # A separate matcher for the same gestures shares the cached results.
+        moosegesture.GestureMatcher([[UP, LEFT], [DOWN, RIGHT, DOWN]], cache=moosegesture.matchCache).match([UP, UP])
+        self.assertEqual(moosegesture.matchCache.hits, hits + 3)
+
+    def test_findClosestAlternatingVocabularies(self):
+        first = [[DOWN, LEFT, DOWN], [DOWN, RIGHT, UPRIGHT]]
+        second = ([UP], [UP, RIGHT]) # any sequence of gestures works
+        matchers = (moosegesture._matcherFor(first), moosegesture._matcherFor(second))
+        hits = moosegesture.matchCache.hits
+        for i in range(3):
+            self.assertEqual(moosegesture.findClosestMatchingGesture([DOWN, LEFT], first), ((DOWN, LEFT, DOWN),))
+            self.assertEqual(moosegesture.findClosestMatchingGesture([UP, LEFT], second), ((UP,), (UP, RIGHT)))
+        self.assertEqual((moosegesture._matcherFor(first), moosegesture._matcherFor(second)), matchers)
+        self.assertEqual(moosegesture.matchCache.hits, hits + 4) # only the first call for each vocabulary misses
+        first.append([LEFT])
+        self.assertEqual(moosegesture.findClosestMatchingGesture([DOWN, LEFT], first), ((DOWN, LEFT, DOWN), (LEFT,)))
+
+class TestKClosest(unittest.TestCase):
+    def kClosestBruteForce(self, strokes, gestureList, k, maxDifference=None):
+        ranked = []
+        for i, gesture in enumerate(moosegesture._uniqueGestures(gestureList)):
+            levDist = moosegesture.levenshteinDistance(strokes, gesture)
+            if maxDifference is None or levDist <= maxDifference:
+                ranked.append((levDist, i, gesture))
+        ranked.sort()
+        return [(levDist, gesture) for levDist, i, gesture in ranked[:k]]
+
+    def test_matchesBruteForce(self):
+        vocabulary = randomGestures(7, numGestures=200, maxLen=6)
+        matcher = moosegesture.GestureMatcher(vocabulary)
+        pythonMatcher = moosegesture.GestureMatcher(vocabulary)
+        pythonMatcher._vocabularyArray = None
+        bkTree = moosegesture.BKTreeMatcher(vocabulary)
+        for strokes in randomGestures(8, numGestures=50, maxLen=6) + vocabulary[:5]:
+            for k in (1, 3, 10):
+                for maxDifference in (None, 0, 2):
+                    expected = self.kClosestBruteForce(strokes, vocabulary, k, maxDifference)
+                    self.assertEqual(matcher.kClosest(strokes, k, maxDifference), expected)
+                    self.assertEqual(pythonMatcher.kClosest(strokes, k, maxDifference), expected)
+                    self.assertEqual(bkTree.kClosest(strokes, k, maxDifference), expected)
+
+    def test_findKClosestGestures(self):
+        gestures = [[DOWN, LEFT, DOWN], [DOWN, RIGHT, UPRIGHT], [DOWN, LEFT]]
+        self.assertEqual(moosegesture.findKClosestGestures([DOWN, LEFT, RIGHT], gestures, 2),
+                         [(1, (DOWN, LEFT, DOWN)), (1, (DOWN, LEFT))])
+        self.assertEqual(moosegesture.findKClosestGestures([DOWN, LEFT, RIGHT], gestures, 0), [])
+        self.assertEqual(moosegesture.findKClosestGestures([UP], gestures, 3, maxDifference=1), [])
+
+
+class TestGestureDistanceMatrix(unittest.TestCase):
+    def checkMatrix(self, matrix, gestures, maxDistance=None):
+        k = 0
+        for i in range(len(gestures)):
+            for j in range(i + 1, len(gestures)):
+                levDist = moosegesture.levenshteinDistance(gestures[i], gestures[j])
+                if maxDistance is not None:
+                    levDist = min(levDist, maxDistance + 1)
+                self.assertEqual((i, j, matrix[k]), (i, j, levDist))
+                k += 1
+        self.assertEqual(len(matrix), k)
+
+    def test_matchesLevenshtein(self):
+        gestures = randomGestures(10, numGestures=60) + [[]] + randomGestures(10, numGestures=10) # with duplicates
+        self.checkMatrix(moosegesture.gestureDistanceMatrix(gestures), gestures)
+        self.checkMatrix(moosegesture.gestureDistanceMatrix(gestures, workers=2, tileSize=16), gestures)
+        self.checkMatrix(moosegesture.gestureDistanceMatrix(gestures, maxDistance=2, tileSize=16), gestures, maxDistance=2)
+
+    @unittest.skipIf(moosegesture.numpy is None, 'NumPy is not installed')
+    def test_memoryMappedFile(self):
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            unique = [list(gesture) for gesture in set(tuple(gesture) for gesture in randomGestures(12, numGestures=50))]
+            for gestures in (unique, unique + unique[:10]):
+                filename = os.path.join(directory, 'matrix%d.bin' % len(gestures))
+                matrix = moosegesture.gestureDistanceMatrix(gestures, maxDistance=2, filename=filename, tileSize=16)
+                self.assertTrue(isinstance(matrix, moosegesture.numpy.memmap))
+                self.checkMatrix(matrix.tolist(), gestures, maxDistance=2)
+                del matrix
+        finally:
+            import shutil
+            shutil.rmtree(directory)
+
+    def test_withoutNumpy(self):
+        gestures = randomGestures(11, numGestures=40) * 2
+        numpyModule = moosegesture._moosegesture_numpy
+        moosegesture._moosegesture_numpy = None
+        try:
+            self.checkMatrix(moosegesture.gestureDistanceMatrix(gestures, maxDistance=3, tileSize=16), gestures, maxDistance=3)
+        finally:
+            moosegesture._moosegesture_numpy = numpyModule
+
+    def test_typecode(self):
+        self.assertEqual(moosegesture.gestureDistanceMatrix([[UP], [DOWN]]).typecode, 'B')
+        self.assertEqual(moosegesture.gestureDistanceMatrix([[UP] * 300, [DOWN]]).tolist(), [300])
+        self.assertEqual(moosegesture.gestureDistanceMatrix([[UP] * 300, [DOWN]], maxDistance=10).tolist(), [11])
+        self.assertRaises(ValueError, moosegesture.gestureDistanceMatrix, [[UP], [DOWN, LEFT, RIGHT]], maxDistance=-1)
+        self.assertEqual(len(moosegesture.gestureDistanceMatrix([])), 0)
+
+
+class TestGestureTrie(unittest.TestCase):
+    def test_reachable(self):
+        trie = moosegesture.GestureTrie([[UP, RIGHT], [UP, RIGHT, DOWN], [UP, LEFT], [DOWN], [UP, RIGHT]])
+        self.assertEqual(len(trie), 4)
+        self.assertEqual(trie.reachable([]), ((UP, RIGHT), (UP, RIGHT, DOWN), (UP, LEFT), (DOWN,)))
+        self.assertEqual(trie.reachable([UP]), ((UP, RIGHT), (UP, RIGHT, DOWN), (UP, LEFT)))
+        self.assertEqual(trie.reachable([UP, RIGHT]), ((UP, RIGHT), (UP, RIGHT, DOWN)))
+        self.assertEqual(trie.reachable([UP, DOWN]), ())
+        self.assertTrue(trie.isDeadPrefix([RIGHT]))
+        self.assertFalse(trie.isDeadPrefix([UP, RIGHT, DOWN]))
+        self.assertTrue(trie.isDeadPrefix([UP, RIGHT, DOWN, LEFT]))
+
+    def test_uniqueCompletion(self):
+        trie = moosegesture.GestureTrie([[UP, RIGHT], [UP, RIGHT, DOWN], [UP, LEFT]])
+        self.assertEqual(trie.uniqueCompletion([UP]), None)
+        self.assertEqual(trie.uniqueCompletion([UP, LEFT]), (UP, LEFT))
+        self.assertEqual(trie.uniqueCompletion([UP, RIGHT, DOWN]), (UP, RIGHT, DOWN))
+        self.assertEqual(trie.uniqueCompletion([LEFT]), None)
+
+
 if __name__ == '__main__':
     unittest.main()